@@ -1,10 +1,11 @@
 import os.path
 
-import envparse
-
 
 def main():
     if os.path.isfile(".env"):
+        # Only pay for importing envparse when there's something for it to read.
+        import envparse
+
         envparse.Env.read_envfile(".env")
     from ruff_usage_aggregate.cli import main
 
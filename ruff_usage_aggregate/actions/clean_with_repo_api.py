@@ -1,22 +1,33 @@
 """Removes forks, missing repositories and repositories without a path to create a
 clean dataset to use with ecosystem checks"""
 
+from __future__ import annotations
+
 import asyncio
 import dataclasses
-import json
 import logging
-from asyncio import Semaphore
+import os
+import random
+import time
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
 
-from httpx import AsyncClient, HTTPError
+from httpx import AsyncClient, HTTPError, HTTPStatusError, TransportError
 from tqdm import tqdm
 
 from ruff_usage_aggregate.helpers.jsonl import read_jsonl, write_jsonl
+from ruff_usage_aggregate.helpers.rate_limit import GITHUB_RATE_LIMITER
 
 logger = logging.getLogger(__name__)
 
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Transient errors (server errors, rate limiting, connection problems) are retried this many times,
+# waiting about RETRY_BACKOFF * 2**attempt seconds in between.
+MAX_RETRIES = 4
+RETRY_BACKOFF = 2.0
+
 
 # https://stackoverflow.com/a/71666789/3549270
 class RepoStatus(str, Enum):
@@ -25,6 +36,12 @@ class RepoStatus(str, Enum):
     ERROR = "error"
 
 
+class GraphQLQueryError(HTTPError):
+    """
+    A GraphQL request that returned no data at all (e.g. because it was rate limited).
+    """
+
+
 @dataclass
 class RepoInfo:
     owner: str
@@ -34,14 +51,19 @@ class RepoInfo:
     status: RepoStatus
 
 
-async def query_github(owner: str, repo: str, path: str, client: AsyncClient, github_token: str) -> RepoInfo:
-    # E.g. https://api.github.com/repos/Hadryan/OpenBBTerminal
-    url = f"https://api.github.com/repos/{owner}/{repo}"
-    headers = {
+def _get_headers(github_token: str) -> dict[str, str]:
+    return {
         "Authorization": f"Bearer {github_token}",
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) RUA",
     }
-    response = await client.get(url, headers=headers, follow_redirects=True)
+
+
+async def query_github(owner: str, repo: str, path: str, client: AsyncClient, github_token: str) -> RepoInfo:
+    # E.g. https://api.github.com/repos/Hadryan/OpenBBTerminal
+    url = f"https://api.github.com/repos/{owner}/{repo}"
+    response = await GITHUB_RATE_LIMITER.send_async(
+        lambda: client.get(url, headers=_get_headers(github_token), follow_redirects=True),
+    )
     # GitHub also returns 404 for private repositories
     if response.status_code == 404:
         return RepoInfo(owner, repo, path, None, RepoStatus.ERROR)
@@ -51,25 +73,156 @@ async def query_github(owner: str, repo: str, path: str, client: AsyncClient, gi
         repo_status = RepoStatus.FORK
     else:
         repo_status = RepoStatus.REPO
-    return RepoInfo(owner, repo, path, data["ref"], repo_status)
+    return RepoInfo(owner, repo, path, data["default_branch"], repo_status)
+
+
+def get_graphql_query(n: int) -> str:
+    """
+    Get a GraphQL query for `n` repositories, aliased `r0`...`r{n-1}`, with variables `$owner{i}`/`$name{i}`.
+    """
+    variables = ", ".join(f"$owner{i}: String!, $name{i}: String!" for i in range(n))
+    fields = " ".join(
+        f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{ isFork defaultBranchRef {{ name }} }}" for i in range(n)
+    )
+    return f"query({variables}) {{ {fields} }}"
 
 
-async def query_github_slow(
-    owner: str,
-    repo: str,
-    path: str,
+async def query_github_graphql(
+    repos: list[tuple[str, str, str]],
     client: AsyncClient,
     github_token: str,
-    slow_down: Semaphore,
-) -> RepoInfo | tuple[str, str, HTTPError]:
-    # There is an actual ratelimit with github (5000 requests per hour), but we still want 3k parallel requests,
-    # so we slow it down to 50 (see below) at the same time here
-    async with slow_down:
+) -> list[RepoInfo | tuple[str, str, HTTPError]]:
+    """
+    Query a batch of (owner, repo, path) in a single GraphQL request.
+    """
+    variables = {}
+    for i, (owner, repo, _) in enumerate(repos):
+        variables[f"owner{i}"] = owner
+        variables[f"name{i}"] = repo
+    response = await GITHUB_RATE_LIMITER.send_async(
+        lambda: client.post(
+            GRAPHQL_URL,
+            json={"query": get_graphql_query(len(repos)), "variables": variables},
+            headers=_get_headers(github_token),
+        ),
+    )
+    response.raise_for_status()
+    body = response.json()
+    data = body.get("data")
+    if data is None:
+        raise GraphQLQueryError(f"GraphQL query failed: {body.get('errors')}")
+    # Missing (or private) repositories are null, with a NOT_FOUND error; anything else is a failure to retry.
+    errors = {error["path"][0]: error for error in body.get("errors", []) if error.get("path")}
+    results = []
+    for i, (owner, repo, path) in enumerate(repos):
+        node = data.get(f"r{i}")
+        error = errors.get(f"r{i}")
+        if node is not None:
+            repo_status = RepoStatus.FORK if node["isFork"] else RepoStatus.REPO
+            ref = (node.get("defaultBranchRef") or {}).get("name")
+            results.append(RepoInfo(owner, repo, path, ref, repo_status))
+        elif error is None or error.get("type") == "NOT_FOUND":
+            results.append(RepoInfo(owner, repo, path, None, RepoStatus.ERROR))
+        else:
+            results.append((owner, repo, HTTPError(error.get("message", "GraphQL error"))))
+    return results
+
+
+def _is_transient(error: HTTPError) -> bool:
+    if isinstance(error, GraphQLQueryError):
+        return True
+    if isinstance(error, HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, TransportError)
+
+
+async def query_github_with_retries(
+    repos: list[tuple[str, str, str]],
+    client: AsyncClient,
+    github_token: str,
+    graphql: bool,
+) -> list[RepoInfo | tuple[str, str, HTTPError]]:
+    """
+    Query a batch of (owner, repo, path) with GraphQL, or a single one with REST,
+    retrying transient errors with exponential backoff.
+
+    Failed queries are returned as (owner, repo, error) tuples.
+    """
+    attempt = 0
+    while True:
         try:
-            return await query_github(owner, repo, path, client, github_token)
+            if graphql:
+                return await query_github_graphql(repos, client, github_token)
+            ((owner, repo, path),) = repos
+            return [await query_github(owner, repo, path, client, github_token)]
         except HTTPError as e:
-            # Don't lose the error source across as_completed
-            return owner, repo, e
+            if attempt == MAX_RETRIES or not _is_transient(e):
+                return [(owner, repo, e) for owner, repo, _ in repos]
+            delay = RETRY_BACKOFF * 2**attempt * (1 + random.random())
+            logger.warning(f"Retrying {len(repos)} repositories in {delay:.1f}s after {e!r}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class RepoApiCache:
+    """
+    Repository API results, keyed by (owner, repo), with the time they were fetched.
+
+    The cache file is JSONL that is only appended to while running (later lines win, so the
+    cache survives crashes mid-run); duplicate lines are compacted away when closing.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[tuple[str, str], dict] = {}
+        self.n_lines = 0
+        if path.is_file():
+            for entry in read_jsonl(path):
+                self.entries[(entry["owner"], entry["repo"])] = entry
+                self.n_lines += 1
+        self._fp = None
+
+    def __enter__(self) -> RepoApiCache:
+        self._fp = self.path.open("a")
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._fp.close()
+        self._fp = None
+        if self.n_lines > len(self.entries):
+            self.compact()
+
+    def get(self, owner: str, repo: str, max_age: float | None = None) -> dict | None:
+        """
+        Get the cached entry for a repository, unless it's older than `max_age` seconds.
+
+        Entries from before fetch times were recorded count as infinitely old.
+        """
+        entry = self.entries.get((owner, repo))
+        if entry and max_age is not None and time.time() - entry.get("fetched_at", 0) > max_age:
+            return None
+        return entry
+
+    def put(self, repo_info: RepoInfo) -> None:
+        entry = {
+            "owner": repo_info.owner,
+            "repo": repo_info.repo,
+            "ref": repo_info.ref,
+            "status": repo_info.status,
+            "fetched_at": int(time.time()),
+        }
+        self.entries[(repo_info.owner, repo_info.repo)] = entry
+        # Write them here already so it survives in case of crash
+        # (in the same format as `compact` writes, so compacting doesn't rewrite every line).
+        write_jsonl(self._fp, [entry])
+        self._fp.flush()
+        self.n_lines += 1
+
+    def compact(self) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        self.n_lines = write_jsonl(tmp_path, self.entries.values())
+        os.replace(tmp_path, self.path)
+        logger.info(f"Compacted {self.path} to {self.n_lines} entries")
 
 
 async def clean_with_repo_api_async(
@@ -77,49 +230,66 @@ async def clean_with_repo_api_async(
     known_github_tomls_no_forks: Path,
     repo_api_data: Path,
     github_token: str,
-):
+    max_age: float | None = None,
+    graphql_batch_size: int | None = None,
+    concurrency: int = 50,
+) -> int:
+    """
+    Query the repositories not in the `repo_api_data` cache (or whose entry is older than `max_age` seconds)
+    and write the records of the ones that aren't forks to `known_github_tomls_no_forks`; returns their number.
+
+    Repositories are queried one REST request at a time, or in batches of `graphql_batch_size`
+    per GraphQL request if given, by `concurrency` workers.
+    """
     repos = list(read_jsonl(known_github_tomls))
-    paths = {}
-    for repo in repos:
-        if path := repo.get("path"):
-            paths[(repo["owner"], repo["repo"])] = path
-    known_info: dict[(str, str), RepoInfo] = {}
-    for entry in read_jsonl(repo_api_data):
-        if path := paths[(entry["owner"], entry["repo"])]:
-            known_info[(entry["owner"], entry["repo"])] = RepoInfo(path=path, **entry)
-
-    with repo_api_data.open("a") as is_fork_fp:
-        async with AsyncClient() as client:
-            slow_down = Semaphore(50)
-            tasks = []
-            for repo in repos:
-                if (repo["owner"], repo["repo"]) not in known_info:
-                    tasks.append(
-                        asyncio.create_task(
-                            query_github_slow(
-                                repo["owner"],
-                                repo["repo"],
-                                repo["path"],
-                                client,
-                                github_token,
-                                slow_down,
-                            ),
-                        ),
-                    )
-            for completed in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
-                repo_info = await completed
-                if isinstance(repo_info, RepoInfo):
-                    # Write them here already so it survives in case of crash
-                    is_fork_fp.write(json.dumps(dataclasses.asdict(repo_info)) + "\n")
-                    known_info[(repo_info.owner, repo_info.repo)] = repo_info
-                else:
-                    logger.error(f"Failed to query {repo_info[0]}/{repo_info[1]}: {repo_info[2]}")
+    with RepoApiCache(repo_api_data) as cache:
+        to_query = {}
+        for repo in repos:
+            if not cache.get(repo["owner"], repo["repo"], max_age):
+                to_query.setdefault((repo["owner"], repo["repo"]), repo)
+        logger.info(f"{len(to_query)} of {len(cache.entries)} cached repositories need to be queried")
+
+        batch_size = graphql_batch_size or 1
+        query_list = [(repo["owner"], repo["repo"], repo["path"]) for repo in to_query.values()]
+        # Only a bounded number of batches is queued up at a time, so memory use doesn't grow
+        # with the number of repositories to query.
+        queue: asyncio.Queue[list[tuple[str, str, str]] | None] = asyncio.Queue(maxsize=concurrency * 2)
+
+        async def _producer():
+            for start in range(0, len(query_list), batch_size):
+                await queue.put(query_list[start : start + batch_size])
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def _worker(client: AsyncClient, progress: tqdm):
+            while (batch := await queue.get()) is not None:
+                for repo_info in await query_github_with_retries(batch, client, github_token, bool(graphql_batch_size)):
+                    if isinstance(repo_info, RepoInfo):
+                        cache.put(repo_info)
+                    else:
+                        logger.error(f"Failed to query {repo_info[0]}/{repo_info[1]}: {repo_info[2]}")
+                progress.update(len(batch))
+
+        # The actual rate limit (5000 requests per hour) is paced by the client's rate limiter hooks;
+        # the number of workers just caps the number of requests in flight at once.
+        async with AsyncClient(event_hooks=GITHUB_RATE_LIMITER.async_event_hooks()) as client:
+            with tqdm(total=len(query_list)) as progress:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(_producer())
+                    for _ in range(concurrency):
+                        tg.create_task(_worker(client, progress))
 
     repos_no_forks = []
     for repo in repos:
-        if repo_info := known_info.get((repo["owner"], repo["repo"])):
-            if repo_info.status == RepoStatus.REPO:
-                repos_no_forks.append(dataclasses.asdict(repo_info))
+        # A stale entry that couldn't be refreshed is still better than nothing.
+        if (entry := cache.get(repo["owner"], repo["repo"])) and repo.get("path"):
+            if entry["status"] == RepoStatus.REPO:
+                repos_no_forks.append(
+                    dataclasses.asdict(
+                        RepoInfo(repo["owner"], repo["repo"], repo["path"], entry["ref"], RepoStatus.REPO),
+                    ),
+                )
 
     print(f"{len(repos_no_forks)} of {len(repos)} repositories are not forks")
     write_jsonl(known_github_tomls_no_forks, repos_no_forks)
+    return len(repos_no_forks)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import contextlib
+import csv
+import heapq
+import itertools
+import logging
+import pathlib
+import tempfile
+from collections.abc import Iterable
+from typing import TextIO
+
+from ruff_usage_aggregate.helpers.jsonl import is_jsonl_filename, open_maybe_compressed, read_jsonl, write_jsonl
+
+log = logging.getLogger(__name__)
+
+RecordKey = tuple[str, str, str]
+
+
+def get_record_key(record: dict) -> RecordKey:
+    return (record["owner"], record["repo"], record["path"])
+
+
+def get_search_item_record(item: dict) -> dict:
+    """
+    Convert a GitHub code search result item to a "known tomls" record.
+    """
+    return {
+        "owner": item["repository"]["owner"]["login"],
+        "repo": item["repository"]["name"],
+        "path": item["path"],
+    }
+
+
+def read_combine_input(input_file: pathlib.Path | TextIO) -> Iterable[dict]:
+    """
+    Read "known tomls" records from a CSV file, a known-tomls JSONL file or a GitHub search result JSONL file.
+
+    JSONL files may be gzip or zstd compressed.
+    """
+    name = str(input_file) if isinstance(input_file, pathlib.Path) else input_file.name
+    if name.endswith(".csv"):
+        with (
+            open_maybe_compressed(input_file, "r")
+            if isinstance(input_file, pathlib.Path)
+            else contextlib.nullcontext(input_file)
+        ) as f:
+            yield from csv.DictReader(f)
+    elif is_jsonl_filename(name):
+        for line in read_jsonl(input_file):
+            if line.get("total_count") and line.get("items"):  # smells like a GitHub Search line
+                for item in line["items"]:
+                    yield get_search_item_record(item)
+            elif all(k in line for k in ("owner", "repo", "path")):
+                yield line
+            else:
+                log.warning(f"Unknown JSONL line: {line}")
+
+
+def merge_record(existing: dict, new: dict) -> None:
+    """
+    Merge `new` into `existing` (which has the same key).
+
+    Values from `new` take precedence, except that missing or empty values
+    (e.g. a search result without a `ref`) never replace known ones.
+    """
+    for field, value in new.items():
+        if value is None or value == "":
+            existing.setdefault(field, value)
+            continue
+        old_value = existing.get(field)
+        if old_value not in (None, "", value):
+            log.debug(f"{get_record_key(existing)}: {field} {old_value!r} -> {value!r}")
+        existing[field] = value
+
+
+def combine_records(records: Iterable[dict]) -> list[dict]:
+    """
+    Combine records into one per (owner, repo, path), sorted by that key.
+
+    Records later in the input take precedence (see `merge_record`), so later input files
+    override earlier ones.
+    """
+    index: dict[RecordKey, dict] = {}
+    for record in records:
+        key = get_record_key(record)
+        if (existing := index.get(key)) is not None:
+            merge_record(existing, record)
+        else:
+            index[key] = dict(record)
+    return [index[key] for key in sorted(index)]
+
+
+def _merge_runs(run_paths: list[pathlib.Path]) -> Iterable[dict]:
+    # `heapq.merge` is stable, so records with the same key come out in run (i.e. input) order.
+    merged = heapq.merge(*(read_jsonl(run_path) for run_path in run_paths), key=get_record_key)
+    for _key, group in itertools.groupby(merged, key=get_record_key):
+        record = next(group)
+        for other in group:
+            merge_record(record, other)
+        yield record
+
+
+def combine_records_external(records: Iterable[dict], run_size: int, max_fan_in: int = 128) -> Iterable[dict]:
+    """
+    Like `combine_records`, but with bounded memory use, for inputs larger than RAM.
+
+    Records are combined in runs of at most `run_size` records, each written to a temporary file;
+    the sorted runs are then k-way merged (at most `max_fan_in` files at a time), merging records
+    with the same key in input order, so the output is the same as `combine_records` would give.
+    """
+    with tempfile.TemporaryDirectory(prefix="rua-combine-") as temp_dir:
+        temp_path = pathlib.Path(temp_dir)
+        n_runs = 0
+
+        def _write_run(run_records: Iterable[dict]) -> pathlib.Path:
+            nonlocal n_runs
+            run_path = temp_path / f"run-{n_runs:06d}.jsonl"
+            n_runs += 1
+            write_jsonl(run_path, run_records)
+            return run_path
+
+        run_paths = []
+        records = iter(records)
+        while run := list(itertools.islice(records, run_size)):
+            run_paths.append(_write_run(combine_records(run)))
+        log.info(f"Merging {len(run_paths)} sorted runs")
+        while len(run_paths) > max_fan_in:
+            merged_paths = []
+            for i in range(0, len(run_paths), max_fan_in):
+                batch = run_paths[i : i + max_fan_in]
+                merged_paths.append(_write_run(_merge_runs(batch)))
+                for run_path in batch:
+                    run_path.unlink()
+            run_paths = merged_paths
+        yield from _merge_runs(run_paths)
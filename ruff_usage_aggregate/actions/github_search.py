@@ -1,54 +1,232 @@
+import dataclasses
+import json
 import logging
-import time
+import math
+import os
+import pathlib
 from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 import httpx
 
-from ruff_usage_aggregate.helpers.zzz import sleep_with_progress
+from ruff_usage_aggregate.actions.combine import get_search_item_record
+from ruff_usage_aggregate.helpers.rate_limit import GITHUB_RATE_LIMITER
 
 log = logging.getLogger(__name__)
 
+BASE_QUERY = "ruff in:file"
+
+# GitHub code search never returns more than this many results for a query...
+MAX_RESULTS = 1000
+PER_PAGE = 100
+
+# ... and only indexes files smaller than 384 KB.
+MAX_FILE_SIZE = 384 * 1024
+
+FILENAMES = ("pyproject.toml", "ruff.toml", ".ruff.toml")
+
+# How many of the most recently indexed results of each query to remember as its high-water mark
+# (more than one, in case the newest one disappears from the index).
+HIGH_WATER_MARK_SIZE = 20
+
+SearchItemKey = tuple[str, str, str]
+
+
+def get_search_item_key(item: dict) -> SearchItemKey:
+    return (item["repository"]["full_name"], item["path"], item["sha"])
+
+
+class SearchHighWaterMarks:
+    """
+    The most recently indexed (repo, path, sha) results seen per search query, saved as JSON.
+
+    Since results are sorted by indexing time, newest first, paginating can stop at the first known result.
+    A query's mark is only moved once all of its new results have been fetched, so an interrupted run
+    doesn't skip anything the next time.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.marks: dict[str, list[SearchItemKey]] = {}
+        if path.is_file():
+            self.marks = {query: [tuple(key) for key in keys] for query, keys in json.loads(path.read_text()).items()}
+        self._pending: dict[str, list[SearchItemKey]] = {}
+
+    def get_known(self, query: str) -> set[SearchItemKey]:
+        return set(self.marks.get(query, ()))
+
+    def start(self, query: str, first_page_items: list[dict]) -> None:
+        self._pending[query] = [get_search_item_key(item) for item in first_page_items[:HIGH_WATER_MARK_SIZE]]
+
+    def finish(self, query: str) -> None:
+        if keys := self._pending.pop(query, None):
+            self.marks[query] = keys
+            self.save()
+
+    def save(self) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.marks, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+
+@dataclasses.dataclass(frozen=True)
+class SearchPartition:
+    """
+    A slice of the search space, narrowed down with `filename:`, `size:` and `path:` qualifiers.
+    """
+
+    filename: str | None = None
+    size: tuple[int, int] | None = None  # inclusive range, in bytes
+    path: str | None = None
+
+    @property
+    def query(self) -> str:
+        parts = [BASE_QUERY]
+        if self.filename:
+            parts.append(f"filename:{self.filename}")
+        else:
+            parts.append("extension:toml")
+        if self.size:
+            parts.append(f"size:{self.size[0]}..{self.size[1]}")
+        if self.path:
+            parts.append(f"path:{self.path}")
+        return " ".join(parts)
+
+    def split(self) -> list["SearchPartition"]:
+        """
+        Split this partition into two by halving its size range; returns an empty list if that's not possible.
+        """
+        low, high = self.size or (0, MAX_FILE_SIZE)
+        if low == high:
+            return []
+        middle = (low + high) // 2
+        return [
+            dataclasses.replace(self, size=(low, middle)),
+            dataclasses.replace(self, size=(middle + 1, high)),
+        ]
+
+
+def get_initial_partitions(partition: bool) -> list[SearchPartition]:
+    if not partition:
+        return [SearchPartition()]
+    return [SearchPartition(filename=filename) for filename in FILENAMES]
+
+
+def _fetch_search_page(client: httpx.Client, github_token: str, query: str, page: int) -> dict:
+    log.info(f"Fetching page {page} of {query!r}")
+    resp = GITHUB_RATE_LIMITER.send_sync(
+        lambda: client.get(
+            "https://api.github.com/search/code",
+            params={
+                "q": query,
+                "per_page": PER_PAGE,
+                "page": page,
+                "sort": "indexed",
+                "order": "desc",
+            },
+            headers={
+                "Accept": "application/vnd.github.v3+json",
+                "Authorization": f"Bearer {github_token}",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+        ),
+    )
+    if resp.status_code == 422:
+        log.error(f"GitHub rejected the search query {query!r}")
+    if resp.status_code != 200:
+        print(resp.headers)
+        print(resp.content)
+        print(resp.status_code)
+        resp.raise_for_status()
+    return resp.json()
+
 
 def scan_github_search(
     *,
     github_token: str,
+    partition: bool = True,
+    concurrency: int = 4,
+    high_water_marks: SearchHighWaterMarks | None = None,
+) -> Iterable[dict]:
+    """
+    Search GitHub for TOML files mentioning Ruff, yielding the raw result pages (empty pages are skipped).
+
+    To get past the 1000-result cap of a single query, the search space is partitioned by file name
+    and then recursively by file size, until each partition has at most 1000 results. Pages are fetched
+    `concurrency` at a time, paced by the search rate limit.
+
+    With `high_water_marks`, each query's pages are fetched in order only until a result seen in an
+    earlier run turns up, and pages only contain the new results.
+    """
+    with (
+        httpx.Client(event_hooks=GITHUB_RATE_LIMITER.sync_event_hooks()) as client,
+        ThreadPoolExecutor(concurrency) as executor,
+    ):
+        futures: dict[Future, tuple[SearchPartition, int]] = {}
+        n_pages: dict[SearchPartition, int] = {}
+
+        def _submit(part: SearchPartition, page: int) -> None:
+            futures[executor.submit(_fetch_search_page, client, github_token, part.query, page)] = (part, page)
+
+        for part in get_initial_partitions(partition):
+            _submit(part, 1)
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                part, page = futures.pop(future)
+                data = future.result()
+                if page == 1:
+                    total_count = data.get("total_count", 0)
+                    if total_count > MAX_RESULTS and partition:
+                        if subparts := part.split():
+                            log.info(f"{part.query!r}: {total_count} results, splitting")
+                            for subpart in subparts:
+                                _submit(subpart, 1)
+                            continue
+                        if not part.path:
+                            # Can't split by size any further, but at least get the top-level files complete.
+                            _submit(dataclasses.replace(part, path="/"), 1)
+                    if total_count > MAX_RESULTS:
+                        log.warning(f"{part.query!r}: {total_count} results, only {MAX_RESULTS} are available")
+                    n_pages[part] = math.ceil(min(total_count, MAX_RESULTS) / PER_PAGE)
+                    if high_water_marks is None:
+                        for next_page in range(2, n_pages[part] + 1):
+                            _submit(part, next_page)
+                    else:
+                        high_water_marks.start(part.query, data.get("items", []))
+                if high_water_marks is not None:
+                    known = high_water_marks.get_known(part.query)
+                    items = data.get("items", [])
+                    new_items = []
+                    for item in items:
+                        if get_search_item_key(item) in known:
+                            break
+                        new_items.append(item)
+                    data = {**data, "items": new_items}
+                    if len(new_items) == len(items) and page < n_pages[part]:
+                        _submit(part, page + 1)
+                    else:
+                        log.info(f"{part.query!r}: no more new results after page {page}")
+                        high_water_marks.finish(part.query)
+                if data.get("items"):
+                    yield data
+
+
+def scan_github_search_incremental(
+    *,
+    github_token: str,
+    high_water_marks: SearchHighWaterMarks,
+    partition: bool = True,
+    concurrency: int = 4,
 ) -> Iterable[dict]:
-    with httpx.Client() as client:
-        for page in range(1, 11):
-            while True:
-                print(f"Fetching page {page}")
-                resp = client.get(
-                    "https://api.github.com/search/code",
-                    params={
-                        "q": "ruff in:file extension:toml",
-                        "per_page": 100,
-                        "page": page,
-                        "sort": "indexed",
-                        "order": "desc",
-                    },
-                    headers={
-                        "Accept": "application/vnd.github.v3+json",
-                        "Authorization": f"Bearer {github_token}",
-                        "X-GitHub-Api-Version": "2022-11-28",
-                    },
-                )
-                if resp.status_code in (403, 422):
-                    sleep_time = 10
-                    if "x-ratelimit-reset" in resp.headers:
-                        reset = int(resp.headers["x-ratelimit-reset"])
-                        now = int(time.time())
-                        if reset > now:
-                            sleep_time = (reset - now) + 5  # Add some time to be safe
-                    sleep_with_progress(sleep_time, "Rate limited")
-                    continue
-                break
-            if resp.status_code != 200:
-                print(resp.headers)
-                print(resp.content)
-                print(resp.status_code)
-                resp.raise_for_status()
-            data = resp.json()
-            yield data
-            if not data.get("items"):
-                log.info("Ran out of items.")
-                break
+    """
+    Search GitHub for results not seen in earlier runs, yielding them as "known tomls" records.
+    """
+    for data in scan_github_search(
+        github_token=github_token,
+        partition=partition,
+        concurrency=concurrency,
+        high_water_marks=high_water_marks,
+    ):
+        for item in data["items"]:
+            yield get_search_item_record(item)
@@ -0,0 +1,220 @@
+"""In-process runner for the whole workflow (`run-pipeline`).
+
+The stages (search → combine → download and clean → scan) form a DAG; stages whose
+dependencies are done run concurrently in threads. Each finished stage is checkpointed
+in a manifest in the work directory, along with a fingerprint of its inputs, so rerunning
+after an interruption only runs the stages that didn't finish (or whose inputs changed).
+Within a stage, the existing record-level caches (already downloaded files, the repo API
+cache, the scan cache) mean that a rerun skips the records already processed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+log = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "pipeline-manifest.json"
+
+STAGE_NAMES = ("search", "combine", "download", "clean", "scan")
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    # Runs the stage; returns statistics to record in the manifest.
+    run: Callable[[], dict]
+    depends_on: tuple[str, ...] = ()
+    # Files the stage reads (besides the outputs of the stages it depends on).
+    inputs: tuple[pathlib.Path, ...] = ()
+
+
+class PipelineManifest:
+    """
+    The state of each stage (running, done or failed, with timings and statistics), saved as JSON
+    after every change.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.stages: dict[str, dict] = json.loads(path.read_text())["stages"] if path.is_file() else {}
+        self.lock = threading.Lock()
+
+    def is_done(self, name: str, fingerprint: str) -> bool:
+        entry = self.stages.get(name, {})
+        return entry.get("status") == "done" and entry.get("fingerprint") == fingerprint
+
+    def update(self, name: str, **values) -> None:
+        with self.lock:
+            self.stages.setdefault(name, {}).update(values)
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+            tmp_path.write_text(json.dumps({"stages": self.stages}, indent=2, sort_keys=True))
+            os.replace(tmp_path, self.path)
+
+
+def get_fingerprint(stage: Stage, manifest: PipelineManifest) -> str:
+    """
+    Fingerprint a stage's inputs: its input files, and the completed runs of the stages it depends on.
+    """
+    parts = []
+    for pth in stage.inputs:
+        try:
+            stat = pth.stat()
+        except FileNotFoundError:
+            parts.append([str(pth), None])
+        else:
+            parts.append([str(pth), stat.st_size, stat.st_mtime_ns])
+    for dep in stage.depends_on:
+        parts.append([dep, manifest.stages[dep].get("fingerprint"), manifest.stages[dep].get("finished_at")])
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def run_pipeline(
+    stages: list[Stage],
+    manifest: PipelineManifest,
+    *,
+    max_parallel: int = 2,
+    force: frozenset[str] = frozenset(),
+) -> None:
+    """
+    Run the stages that aren't up to date, in dependency order, at most `max_parallel` at a time.
+    """
+    pending = {stage.name: stage for stage in stages}
+    done: set[str] = set()
+    running: dict[Future, tuple[str, float]] = {}
+    failures = []
+    with ThreadPoolExecutor(max_parallel) as executor:
+        while pending or running:
+            ready = [stage for stage in pending.values() if all(dep in done for dep in stage.depends_on)]
+            for stage in ready:
+                del pending[stage.name]
+                fingerprint = get_fingerprint(stage, manifest)
+                if stage.name not in force and manifest.is_done(stage.name, fingerprint):
+                    log.info(f"Stage {stage.name}: up to date")
+                    done.add(stage.name)
+                    continue
+                log.info(f"Stage {stage.name}: starting")
+                started_at = time.time()
+                manifest.update(stage.name, status="running", fingerprint=fingerprint, started_at=started_at)
+                running[executor.submit(stage.run)] = (stage.name, started_at)
+            if ready and not running:
+                continue  # only skipped stages; see if that unblocked anything
+            if not running:
+                break  # the rest depends on failed stages
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, started_at = running.pop(future)
+                finished_at = time.time()
+                if exc := future.exception():
+                    log.error(f"Stage {name}: failed after {finished_at - started_at:.1f}s: {exc!r}")
+                    manifest.update(name, status="failed", error=repr(exc), finished_at=finished_at)
+                    failures.append(exc)
+                    continue
+                stats = future.result()
+                log.info(f"Stage {name}: done in {finished_at - started_at:.1f}s ({stats})")
+                manifest.update(name, status="done", finished_at=finished_at, stats=stats)
+                done.add(name)
+    if failures:
+        raise failures[0]
+    if pending:
+        raise RuntimeError(f"Stages not run: {', '.join(pending)}")
+
+
+def _write_atomically(path: pathlib.Path, write: Callable[[pathlib.Path], int]) -> int:
+    # Interrupted stages shouldn't leave half-written outputs that look complete.
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    result = write(tmp_path)
+    os.replace(tmp_path, path)
+    return result
+
+
+def get_pipeline_stages(
+    work_dir: pathlib.Path,
+    *,
+    known_tomls: pathlib.Path,
+    repo_api_data: pathlib.Path,
+    github_token: str | None,
+    search: bool = True,
+    clean: bool = True,
+    jobs: int = 1,
+) -> list[Stage]:
+    search_output = work_dir / "search.jsonl"
+    combined_output = work_dir / "known-github-tomls.jsonl"
+    clean_output = work_dir / "known-github-tomls-clean.jsonl"
+    tomls_dir = work_dir / "tomls"
+
+    def _search() -> dict:
+        from ruff_usage_aggregate.actions.github_search import scan_github_search
+        from ruff_usage_aggregate.helpers.jsonl import write_jsonl
+
+        def _write(pth: pathlib.Path) -> int:
+            return write_jsonl(pth, scan_github_search(github_token=github_token))
+
+        return {"pages": _write_atomically(search_output, _write)}
+
+    def _combine() -> dict:
+        from ruff_usage_aggregate.actions.combine import combine_records, read_combine_input
+        from ruff_usage_aggregate.helpers.jsonl import write_jsonl
+
+        def _read_all():
+            yield from read_combine_input(known_tomls)
+            if search:
+                yield from read_combine_input(search_output)
+
+        def _write(pth: pathlib.Path) -> int:
+            return write_jsonl(pth, combine_records(_read_all()))
+
+        return {"records": _write_atomically(combined_output, _write)}
+
+    def _download() -> dict:
+        from ruff_usage_aggregate.actions.toml_download import download_tomls
+        from ruff_usage_aggregate.helpers.jsonl import read_jsonl
+
+        tomls_dir.mkdir(exist_ok=True)
+        outcomes = download_tomls(tomls_dir, list(read_jsonl(combined_output)), github_token)
+        return dict(outcomes)
+
+    def _clean() -> dict:
+        from ruff_usage_aggregate.actions.clean_with_repo_api import clean_with_repo_api_async
+
+        n = asyncio.run(clean_with_repo_api_async(combined_output, clean_output, repo_api_data, github_token))
+        return {"not_forks": n}
+
+    def _scan() -> dict:
+        from ruff_usage_aggregate.actions.scan_tomls import scan_tomls
+        from ruff_usage_aggregate.format.jsonable import format_json
+        from ruff_usage_aggregate.format.markdown import format_markdown
+        from ruff_usage_aggregate.helpers.scan_cache import ScanCache, get_default_cache_path
+
+        with ScanCache(get_default_cache_path(tomls_dir)) as scan_cache:
+            sr = scan_tomls(tomls_dir, jobs=jobs, cache=scan_cache)
+        (work_dir / "results.json").write_text(format_json(sr) + "\n")
+        (work_dir / "results.md").write_text(format_markdown(sr) + "\n")
+        return {"n_total": sr.n_total, "n_unique": sr.n_unique}
+
+    stages = []
+    if search:
+        stages.append(Stage("search", _search))
+    stages.append(
+        Stage(
+            "combine",
+            _combine,
+            depends_on=("search",) if search else (),
+            inputs=(known_tomls,),
+        ),
+    )
+    stages.append(Stage("download", _download, depends_on=("combine",)))
+    if clean:
+        stages.append(Stage("clean", _clean, depends_on=("combine",)))
+    stages.append(Stage("scan", _scan, depends_on=("download",)))
+    return stages
@@ -0,0 +1,229 @@
+"""Probe repositories (e.g. from the Ruff dependents list) for a Ruff configuration file.
+
+For each repository, all the candidate raw URLs (file name × branch guesses) are requested
+concurrently; the bodies are streamed only until "ruff" turns up, and the remaining requests
+are cancelled on the first hit. Repositories where nothing was found are remembered in a
+negative cache, so re-probing the same list skips them until the cache entry expires.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from collections.abc import AsyncIterable, Callable, Iterable
+from pathlib import Path
+
+import httpx
+import tqdm
+
+from ruff_usage_aggregate.actions.toml_download import RAW_HOST
+from ruff_usage_aggregate.helpers.jsonl import read_jsonl
+from ruff_usage_aggregate.helpers.rate_limit import GITHUB_RATE_LIMITER
+
+log = logging.getLogger(__name__)
+
+FILENAME_GUESSES = ("pyproject.toml", "ruff.toml")
+BRANCH_GUESSES = ("main", "master")
+
+NEEDLE = b"ruff"
+
+
+class ProbeNegativeCache:
+    """
+    Repositories in which no Ruff config was found, with the time they were probed, kept in an
+    append-only JSONL file (later lines win).
+    """
+
+    def __init__(self, path: Path, ttl: float) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.checked_at: dict[str, float] = {}
+        if path.is_file():
+            for entry in read_jsonl(path):
+                self.checked_at[entry["repo"]] = entry["checked_at"]
+        self._fp = None
+
+    def __enter__(self) -> ProbeNegativeCache:
+        self._fp = self.path.open("a")
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._fp.close()
+        self._fp = None
+
+    def is_fresh(self, owner_and_repo: str) -> bool:
+        checked_at = self.checked_at.get(owner_and_repo.lower())
+        return checked_at is not None and time.time() - checked_at < self.ttl
+
+    def add(self, owner_and_repo: str) -> None:
+        entry = {"repo": owner_and_repo.lower(), "checked_at": int(time.time())}
+        self.checked_at[entry["repo"]] = entry["checked_at"]
+        self._fp.write(json.dumps(entry, sort_keys=True) + "\n")
+        self._fp.flush()
+
+
+def get_known_repos(known_jsonl_paths: Iterable[Path]) -> set[str]:
+    """
+    Get the (lowercased) owner/repo names in known-tomls style JSONL files.
+    """
+    known = set()
+    for path in known_jsonl_paths:
+        for entry in read_jsonl(path):
+            known.add(f"{entry['owner']}/{entry['repo']}".lower())
+    return known
+
+
+def parse_repo_line(line: str) -> str:
+    """
+    Parse an owner/repo name, or a JSON object with `owner` and `repo`.
+    """
+    line = line.strip()
+    if line.startswith("{"):
+        jd = json.loads(line)
+        return f"{jd['owner']}/{jd['repo']}"
+    return line
+
+
+async def contains_ruff(client: httpx.AsyncClient, url: str) -> bool:
+    """
+    Check whether the file at `url` exists and mentions Ruff, reading only as much of it as needed.
+
+    Rate-limited requests are retried; raises for responses other than 200 or 404 (or if rate limiting
+    doesn't let up), since those don't tell whether the file exists.
+    """
+    resp = await GITHUB_RATE_LIMITER.send_async(lambda: client.send(client.build_request("GET", url), stream=True))
+    try:
+        if resp.status_code == 404:
+            return False
+        resp.raise_for_status()
+        tail = b""
+        async for chunk in resp.aiter_bytes():
+            if NEEDLE in tail + chunk:
+                return True
+            tail = chunk[-(len(NEEDLE) - 1) :]
+    finally:
+        await resp.aclose()
+    return False
+
+
+async def probe_repo(client: httpx.AsyncClient, owner_and_repo: str) -> dict | None:
+    """
+    Find a Ruff config file in a repository by trying all the candidate URLs at once.
+
+    Returns a known-tomls record for the first hit in guess order (so the result doesn't depend on
+    which response happens to arrive first), None if there's definitely nothing there, or raises
+    the first error if there were no hits but some candidate couldn't be checked.
+    """
+    owner, repo = owner_and_repo.split("/", 1)
+    tasks = []
+    for filename in FILENAME_GUESSES:
+        for ref in BRANCH_GUESSES:
+            url = f"https://{RAW_HOST}/{owner_and_repo}/{ref}/{filename}"
+            datum = {"owner": owner, "repo": repo, "path": filename, "ref": ref}
+            tasks.append((asyncio.create_task(contains_ruff(client, url)), datum))
+    error = None
+    try:
+        # The requests are all in flight already; this only waits for the earlier guesses to be decided.
+        for task, datum in tasks:
+            try:
+                if await task:
+                    return datum
+            except httpx.HTTPError as e:
+                error = error or e
+    finally:
+        pending = [task for task, _ in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    if error:
+        raise error
+    return None
+
+
+async def _aiter(repos: Iterable[str] | AsyncIterable[str]) -> AsyncIterable[str]:
+    if isinstance(repos, AsyncIterable):
+        async for repo in repos:
+            yield repo
+    else:
+        for repo in repos:
+            yield repo
+
+
+async def probe_repos_async(
+    repos: Iterable[str] | AsyncIterable[str],
+    *,
+    emit: Callable[[dict], None],
+    known_repos: set[str],
+    negative_cache: ProbeNegativeCache,
+    concurrency: int = 20,
+    on_done: Callable[[str], None] | None = None,
+) -> Counter:
+    """
+    Probe repositories (owner/repo names, which may be streamed in), passing each known-tomls record found
+    (or a `path-unknown` error record) to `emit`.
+
+    `on_done` is called with each input name once it's been dealt with (probed or skipped);
+    not for ones that couldn't be probed, so e.g. a checkpoint doesn't move past them.
+
+    Returns a counter of probe outcomes.
+    """
+    outcomes = Counter()
+    queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=concurrency * 2)
+
+    def _done(owner_and_repo: str) -> None:
+        if on_done:
+            on_done(owner_and_repo)
+
+    async def _producer():
+        seen = set()
+        async for owner_and_repo in _aiter(repos):
+            key = owner_and_repo.lower()
+            if key in seen:
+                _done(owner_and_repo)
+                continue
+            seen.add(key)
+            if key in known_repos:
+                outcomes["known"] += 1
+                _done(owner_and_repo)
+            elif negative_cache.is_fresh(owner_and_repo):
+                outcomes["cached-not-found"] += 1
+                _done(owner_and_repo)
+            else:
+                await queue.put(owner_and_repo)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def _worker(client: httpx.AsyncClient, progress: tqdm.tqdm):
+        while (owner_and_repo := await queue.get()) is not None:
+            try:
+                datum = await probe_repo(client, owner_and_repo)
+            except httpx.HTTPError as e:
+                log.warning(f"Failed to probe {owner_and_repo}: {e!r}")
+                outcomes["error"] += 1
+            else:
+                if datum:
+                    outcomes["found"] += 1
+                    emit(datum)
+                else:
+                    outcomes["not-found"] += 1
+                    negative_cache.add(owner_and_repo)
+                    owner, repo = owner_and_repo.split("/", 1)
+                    emit({"owner": owner, "repo": repo, "error": "path-unknown"})
+                _done(owner_and_repo)
+            progress.update()
+
+    async with httpx.AsyncClient(
+        headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) RUA"},
+        limits=httpx.Limits(max_connections=concurrency * len(FILENAME_GUESSES) * len(BRANCH_GUESSES)),
+        event_hooks=GITHUB_RATE_LIMITER.async_event_hooks(),
+    ) as client:
+        with tqdm.tqdm(unit="repo") as progress:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(_producer())
+                for _ in range(concurrency):
+                    tg.create_task(_worker(client, progress))
+    log.info("Probe outcomes: %s", ", ".join(f"{k}: {v}" for k, v in sorted(outcomes.items())))
+    return outcomes
@@ -1,45 +1,241 @@
+from __future__ import annotations
+
+import contextlib
 import hashlib
 import logging
 import pathlib
 import tomllib
+import zlib
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
 
 from ruff_usage_aggregate.errors import NotRuffyError
-from ruff_usage_aggregate.models import RuffConfig, ScanResult
+from ruff_usage_aggregate.helpers.corpus_store import decode_toml
+from ruff_usage_aggregate.helpers.scan_cache import get_toml_kind
+from ruff_usage_aggregate.models import Aggregator, RuffConfig, ScanResult
+
+if TYPE_CHECKING:
+    from multiprocessing.pool import Pool
+
+    from ruff_usage_aggregate.columnar import ColumnarAggregator
+    from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+    from ruff_usage_aggregate.helpers.scan_cache import ScanCache
 
 log = logging.getLogger(__name__)
 
+# Files are read from a corpus store in batches of this many.
+STORE_READ_BATCH_SIZE = 2048
 
-def scan_tomls(input_directory: pathlib.Path) -> ScanResult:
-    configs = []
-    for pth in input_directory.glob("*.toml"):
-        try:
-            text = pth.read_text()
-            sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
-            toml = tomllib.loads(text)
-        except Exception as e:
-            log.error(f"Error parsing {pth}: {e}")
-            continue
-        if not isinstance(toml, dict):
-            log.warning(f"Unexpected TOML type for {pth}: {type(toml)}")
-            continue
-        name = pth.name
-        if name.endswith("ruff.toml"):
-            # for a ruff.toml, the whole shebang is the config
-            ruff_section = toml
-        else:  # otherwise assume pyproject.toml
-            ruff_section = toml.get("tool", {}).get("ruff")
-        if not isinstance(ruff_section, dict):
-            continue
-        if not ruff_section:
+
+def _scan_toml_file_with_hash(pth: pathlib.Path) -> tuple[str | None, RuffConfig | None]:
+    """
+    Scan a TOML file, returning the hash of its contents and the Ruff config found, if any.
+
+    The hash is None if the file couldn't be read or parsed at all.
+    """
+    try:
+        text = pth.read_text()
+    except Exception as e:
+        log.error(f"Error parsing {pth}: {e}")
+        return (None, None)
+    return _scan_toml_text_with_hash(pth.name, text)
+
+
+def _scan_stored_toml_with_hash(name_and_content: tuple[str, bytes]) -> tuple[str | None, RuffConfig | None]:
+    name, content = name_and_content
+    try:
+        text = decode_toml(content)
+    except Exception as e:
+        log.error(f"Error parsing {name}: {e}")
+        return (None, None)
+    return _scan_toml_text_with_hash(name, text)
+
+
+def _scan_toml_text_with_hash(name: str, text: str) -> tuple[str | None, RuffConfig | None]:
+    try:
+        sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        toml = tomllib.loads(text)
+    except Exception as e:
+        log.error(f"Error parsing {name}: {e}")
+        return (None, None)
+    if not isinstance(toml, dict):
+        log.warning(f"Unexpected TOML type for {name}: {type(toml)}")
+        return (None, None)
+    return (sha256, _get_ruff_config(name, sha256, toml))
+
+
+def _get_ruff_config(name: str, sha256: str, toml: dict) -> RuffConfig | None:
+    if name.endswith("ruff.toml"):
+        # for a ruff.toml, the whole shebang is the config
+        ruff_section = toml
+    else:  # otherwise assume pyproject.toml
+        ruff_section = toml.get("tool", {}).get("ruff")
+    if not isinstance(ruff_section, dict):
+        return None
+    if not ruff_section:
+        return None
+    try:
+        return RuffConfig.from_toml_section(
+            name=name,
+            text_hash=sha256,
+            ruff_section=ruff_section,
+        )
+    except NotRuffyError:
+        log.exception(f"Not ruffy: {name}")
+        return None
+
+
+def _get_chunksize(n_items: int, jobs: int) -> int:
+    return max(1, min(256, n_items // (jobs * 4)))
+
+
+def _make_pool(jobs: int) -> Pool:
+    # `multiprocessing` is slow to import, and serial scans don't need it.
+    import multiprocessing
+
+    return multiprocessing.Pool(jobs)
+
+
+def _scan_toml_files(paths: list[pathlib.Path], jobs: int) -> Iterable[tuple[str | None, RuffConfig | None]]:
+    if jobs <= 1 or not paths:
+        yield from map(_scan_toml_file_with_hash, paths)
+        return
+    # Results are yielded in input order, so the result is identical to a serial scan.
+    with _make_pool(jobs) as pool:
+        yield from pool.imap(_scan_toml_file_with_hash, paths, chunksize=_get_chunksize(len(paths), jobs))
+
+
+def _scan_stored_tomls(
+    store: CorpusStore,
+    blobs: list[tuple[str, str]],
+    jobs: int,
+) -> Iterable[tuple[str | None, RuffConfig | None]]:
+    """
+    Scan stored blobs, given as (name, content hash) pairs.
+    """
+    # Contents are read from the store in batches, so they don't all need to be in memory at once.
+    with _make_pool(jobs) if jobs > 1 and blobs else contextlib.nullcontext() as pool:
+        for start in range(0, len(blobs), STORE_READ_BATCH_SIZE):
+            names, content_hashes = zip(*blobs[start : start + STORE_READ_BATCH_SIZE], strict=True)
+            batch = list(zip(names, store.get_blobs(list(content_hashes)), strict=True))
+            if pool:
+                yield from pool.imap(_scan_stored_toml_with_hash, batch, chunksize=_get_chunksize(len(batch), jobs))
+            else:
+                yield from map(_scan_stored_toml_with_hash, batch)
+
+
+def _scan_toml_files_with_cache(
+    paths: list[pathlib.Path],
+    jobs: int,
+    cache: ScanCache,
+) -> Iterable[RuffConfig | None]:
+    # First figure out which files need to be (re)scanned...
+    path_hashes = []
+    to_scan = []
+    for pth in paths:
+        stat = pth.stat()
+        text_hash = cache.get_text_hash(pth.name, stat)
+        if text_hash and cache.has_config(pth.name, text_hash):
+            path_hashes.append((pth, stat, text_hash))
+        else:
+            path_hashes.append((pth, stat, None))
+            to_scan.append(pth)
+    cache.stats.hits += len(paths) - len(to_scan)
+    cache.stats.misses += len(to_scan)
+    # ... then stream results in the original order, interleaving cached configs with freshly scanned ones.
+    scanned = _scan_toml_files(to_scan, jobs)
+    for pth, stat, text_hash in path_hashes:
+        if text_hash:
+            yield cache.get_config(pth.name, text_hash)[1]
             continue
-        try:
-            rc = RuffConfig.from_toml_section(
-                name=name,
-                text_hash=sha256,
-                ruff_section=ruff_section,
-            )
-        except NotRuffyError:
-            log.exception(f"Not ruffy: {pth}")
+        text_hash, config = next(scanned)
+        if text_hash:
+            cache.put(pth.name, stat, text_hash, config)
+        yield config
+
+
+def iter_scan_corpus_store(
+    store: CorpusStore,
+    *,
+    jobs: int = 1,
+    cache: ScanCache | None = None,
+    shard: tuple[int, int] | None = None,
+) -> Iterable[tuple[RuffConfig, int]]:
+    """
+    Scan the TOML files in a corpus store, yielding the Ruff configs found along with the number of files
+    with the same contents.
+
+    Each unique content is parsed only once; the duplicate counts come from the store's manifest.
+    """
+    # Group files by contents (and kind, since that decides how the contents are parsed),
+    # in the order a scan of the individual files would first encounter them.
+    groups: dict[tuple[str, str], list] = {}
+    for name, content_hash, text_hash in store.iter_index():
+        if not _is_in_shard(name, shard):
             continue
-        configs.append(rc)
-    return ScanResult.from_config_list(configs)
+        group = groups.setdefault((text_hash, get_toml_kind(name)), [name, content_hash, 0])
+        group[2] += 1
+    # The store knows the content hashes, so cached configs can be looked up without reading anything.
+    is_cached = {key: bool(cache and cache.has_config(name, key[0])) for key, (name, _, _) in groups.items()}
+    to_scan = [(name, content_hash) for key, (name, content_hash, _) in groups.items() if not is_cached[key]]
+    if cache:
+        cache.stats.hits += len(groups) - len(to_scan)
+        cache.stats.misses += len(to_scan)
+    scanned = _scan_stored_tomls(store, to_scan, jobs)
+    for key, (name, _, count) in groups.items():
+        if is_cached[key]:
+            config = cache.get_config(name, key[0])[1]
+        else:
+            text_hash, config = next(scanned)
+            if cache and text_hash:
+                cache.put_config(name, text_hash, config)
+        if config is not None:
+            yield (config, count)
+    if cache:
+        log.info(str(cache.stats))
+
+
+def _is_in_shard(name: str, shard: tuple[int, int] | None) -> bool:
+    if not shard:
+        return True
+    index, count = shard
+    return zlib.crc32(name.encode()) % count == index
+
+
+def iter_scan_tomls(
+    input_directory: pathlib.Path | None,
+    *,
+    jobs: int = 1,
+    cache: ScanCache | None = None,
+    shard: tuple[int, int] | None = None,
+) -> Iterable[RuffConfig]:
+    paths = [pth for pth in input_directory.glob("*.toml") if _is_in_shard(pth.name, shard)]
+    if cache:
+        results = _scan_toml_files_with_cache(paths, jobs, cache)
+    else:
+        results = (config for _, config in _scan_toml_files(paths, jobs))
+    for rc in results:
+        if rc is not None:
+            yield rc
+    if cache:
+        log.info(str(cache.stats))
+
+
+def scan_tomls(
+    input_directory: pathlib.Path | None,
+    *,
+    jobs: int = 1,
+    cache: ScanCache | None = None,
+    shard: tuple[int, int] | None = None,
+    store: CorpusStore | None = None,
+    aggregator: Aggregator | ColumnarAggregator | None = None,
+) -> ScanResult:
+    if aggregator is None:
+        aggregator = Aggregator()
+    if store is not None:
+        for rc, count in iter_scan_corpus_store(store, jobs=jobs, cache=cache, shard=shard):
+            aggregator.add(rc, count=count)
+    else:
+        for rc in iter_scan_tomls(input_directory, jobs=jobs, cache=cache, shard=shard):
+            aggregator.add(rc)
+    return aggregator.result()
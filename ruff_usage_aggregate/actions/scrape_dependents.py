@@ -0,0 +1,183 @@
+"""Scrape the repositories depending on Ruff from GitHub's dependents page, and probe them.
+
+This is "unofficial": the dependents page isn't available via the API, so this reads the HTML,
+and may break whenever GitHub changes it. The links are picked out with regular expressions,
+which is a lot faster than parsing each page into a tree.
+
+The pages are paginated with a cursor, so they can only be fetched one after another; the next
+page is fetched while the current one's repositories are being probed. The cursor of the first
+page not completely probed yet is checkpointed, so when GitHub starts responding with 429s,
+the scrape can be stopped and picked up again later instead of starting over.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Callable
+from pathlib import Path
+
+import httpx
+
+from ruff_usage_aggregate.actions.probe_repos import ProbeNegativeCache, probe_repos_async
+from ruff_usage_aggregate.helpers.rate_limit import GITHUB_RATE_LIMITER, is_rate_limited
+
+log = logging.getLogger(__name__)
+
+DEPENDENTS_REPO = "astral-sh/ruff"
+
+# The web pages have no documented rate limit, so back off for longer than for the API when limited.
+RATE_LIMIT_BACK_OFF = 30
+
+REPOSITORY_LINK_RE = re.compile(r'<a\b[^>]*\bdata-hovercard-type="repository"[^>]*>')
+NEXT_LINK_RE = re.compile(r"<a\b([^>]*)>\s*Next\s*</a>")
+HREF_RE = re.compile(r'\bhref="([^"]*)"')
+
+
+def get_dependents_url(repo: str) -> str:
+    return f"https://github.com/{repo}/network/dependents?dependent_type=REPOSITORY"
+
+
+def parse_dependents_page(text: str) -> tuple[list[str], str | None]:
+    """
+    Get the owner/repo names listed on a dependents page, and the URL of the next page (if any).
+    """
+    repos = []
+    for tag in REPOSITORY_LINK_RE.findall(text):
+        if href := HREF_RE.search(tag):
+            repos.append(html.unescape(href.group(1)).strip("/"))
+    next_url = None
+    for attrs in NEXT_LINK_RE.findall(text):
+        # A disabled "Next" button on the last page is a <button>, but be careful anyway.
+        if 'rel="nofollow"' in attrs and (href := HREF_RE.search(attrs)):
+            next_url = html.unescape(href.group(1))
+            break
+    return repos, next_url
+
+
+class DependentsCheckpoint:
+    """
+    The URL of the dependents page to continue scraping from, saved as JSON.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.state: dict = json.loads(path.read_text()) if path.is_file() else {}
+
+    @property
+    def resume_url(self) -> str | None:
+        return self.state.get("next_url")
+
+    def save(self, next_url: str | None, pages: int) -> None:
+        self.state = {"next_url": next_url, "pages": pages, "updated_at": int(time.time())}
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.state, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+
+class _PageTracker:
+    """
+    Keeps track of which scraped pages still have repositories being probed, and moves the checkpoint
+    past the pages that are done (in order). A page with a repository that couldn't be probed is never
+    done, so the next run resumes from it.
+    """
+
+    def __init__(self, checkpoint: DependentsCheckpoint, pages_before: int) -> None:
+        self.checkpoint = checkpoint
+        self.pages_done = pages_before
+        self.outstanding: list[tuple[str | None, Counter]] = []
+
+    def add_page(self, repos: list[str], next_url: str | None) -> None:
+        self.outstanding.append((next_url, Counter(repos)))
+        self._advance()
+
+    def on_done(self, owner_and_repo: str) -> None:
+        for _, repos in self.outstanding:
+            if repos[owner_and_repo] > 0:
+                repos[owner_and_repo] -= 1
+                break
+        self._advance()
+
+    def _advance(self) -> None:
+        while self.outstanding and not self.outstanding[0][1].total():
+            next_url, _ = self.outstanding.pop(0)
+            self.pages_done += 1
+            self.checkpoint.save(next_url, self.pages_done)
+
+
+async def _fetch_page(client: httpx.AsyncClient, url: str) -> tuple[list[str], str | None] | None:
+    """
+    Fetch and parse a dependents page; returns None if rate limiting doesn't let up.
+    """
+    log.info(f"Fetching {url}")
+    resp = await GITHUB_RATE_LIMITER.send_async(lambda: client.get(url), back_off=RATE_LIMIT_BACK_OFF)
+    if is_rate_limited(resp):
+        return None
+    resp.raise_for_status()
+    return parse_dependents_page(resp.text)
+
+
+async def iter_dependents(client: httpx.AsyncClient, start_url: str, tracker: _PageTracker) -> AsyncIterator[str]:
+    """
+    Yield the owner/repo names from the dependents pages, starting at `start_url`.
+    """
+    next_fetch = asyncio.create_task(_fetch_page(client, start_url))
+    try:
+        while next_fetch:
+            page = await next_fetch
+            next_fetch = None
+            if page is None:
+                log.warning("Still rate limited, stopping; run again later to resume")
+                return
+            repos, next_url = page
+            if next_url:
+                next_fetch = asyncio.create_task(_fetch_page(client, next_url))
+            tracker.add_page(repos, next_url)
+            for repo in repos:
+                yield repo
+    finally:
+        if next_fetch:
+            next_fetch.cancel()
+
+
+async def scrape_dependents_async(
+    *,
+    checkpoint: DependentsCheckpoint,
+    emit: Callable[[dict], None],
+    known_repos: set[str],
+    negative_cache: ProbeNegativeCache,
+    repo: str = DEPENDENTS_REPO,
+    concurrency: int = 20,
+    restart: bool = False,
+) -> Counter:
+    """
+    Scrape the dependents of `repo` (resuming from the checkpoint, unless `restart` is set or the last
+    scrape finished), probing them for Ruff configuration files as they come in; see `probe_repos_async`.
+    """
+    start_url = None if restart else checkpoint.resume_url
+    if start_url:
+        pages_before = checkpoint.state.get("pages", 0)
+        log.info(f"Resuming after page {pages_before}: {start_url}")
+    else:
+        start_url = get_dependents_url(repo)
+        pages_before = 0
+    tracker = _PageTracker(checkpoint, pages_before)
+    async with httpx.AsyncClient(
+        headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) RUA"},
+        event_hooks=GITHUB_RATE_LIMITER.async_event_hooks(),
+        follow_redirects=True,
+    ) as client:
+        return await probe_repos_async(
+            iter_dependents(client, start_url, tracker),
+            emit=emit,
+            known_repos=known_repos,
+            negative_cache=negative_cache,
+            concurrency=concurrency,
+            on_done=tracker.on_done,
+        )
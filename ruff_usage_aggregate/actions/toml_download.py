@@ -1,15 +1,38 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import random
 import re
-from multiprocessing.pool import ThreadPool
+from collections import Counter
 from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
 
 import httpx
 import tqdm
 
+from ruff_usage_aggregate.helpers.corpus_store import get_storage_name
+from ruff_usage_aggregate.helpers.jsonl import read_jsonl
+from ruff_usage_aggregate.helpers.rate_limit import GITHUB_RATE_LIMITER
+
+if TYPE_CHECKING:
+    from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+
 log = logging.getLogger(__name__)
 
+RAW_HOST = "raw.githubusercontent.com"
+API_HOST = "api.github.com"
+
+# Sidecar index of HTTP cache validators (ETag, Last-Modified) for downloaded files.
+VALIDATORS_FILENAME = ".http-validators.jsonl"
+
+# Transient errors (server errors, connection problems) are retried this many times,
+# waiting about RETRY_BACKOFF * 2**attempt seconds in between.
+MAX_RETRIES = 4
+RETRY_BACKOFF = 2.0
+
 
 def convert_github_url_to_raw_url(url: str | None) -> str | None:
     if not url:
@@ -25,54 +48,253 @@ def convert_github_url_to_raw_url(url: str | None) -> str | None:
     return None
 
 
+def get_storage_filename(output_directory: Path, datum: dict) -> Path:
+    return output_directory / get_storage_name(datum)
+
+
+def get_download_request(datum: dict, github_token: str | None = None) -> tuple[str, dict[str, str]]:
+    """
+    Get the URL and headers to download the file described by `datum` with.
+    """
+    repo = f"{datum['owner']}/{datum['repo']}"
+    if datum.get("ref"):
+        return (f"https://{RAW_HOST}/{repo}/{datum['ref']}/{datum['path']}", {})
+    headers = {"Accept": "application/vnd.github.raw"}
+    if github_token:
+        headers["Authorization"] = f"Bearer {github_token}"
+    return (f"https://{API_HOST}/repos/{repo}/contents/{datum['path']}", headers)
+
+
+class ValidatorIndex:
+    """
+    ETag/Last-Modified values for downloaded files, kept in an append-only JSONL file
+    (later lines win) so the index survives crashes mid-download.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.validators: dict[str, dict] = {}
+        if path.is_file():
+            for entry in read_jsonl(path):
+                self.validators[entry["name"]] = entry
+        self._fp = None
+
+    def __enter__(self) -> ValidatorIndex:
+        self._fp = self.path.open("a")
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._fp.close()
+        self._fp = None
+
+    def get_conditional_headers(self, name: str) -> dict[str, str]:
+        entry = self.validators.get(name, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, name: str, response: httpx.Response) -> None:
+        entry = {
+            "name": name,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        }
+        if not (entry["etag"] or entry["last_modified"]) or self.validators.get(name) == entry:
+            return
+        self.validators[name] = entry
+        self._fp.write(json.dumps(entry, sort_keys=True) + "\n")
+        self._fp.flush()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 def download_tomls(
-    output_directory: Path,
+    output_directory: Path | None,
     data: list[dict],
     github_token: str | None = None,
-):
-    def _do_download(datum: dict):
-        if "error" in datum:
-            return
-        if "owner" in datum and "repo" in datum and "path" in datum:
-            download_from_github_datum(
-                client=client,
-                output_directory=output_directory,
-                datum=datum,
-                github_token=github_token,
-            )
-        else:
-            print("Skipping:", datum)
-
-    with httpx.Client() as client:
-        with ThreadPool(5) as pool:
-            for _ in tqdm.tqdm(pool.imap_unordered(_do_download, data), total=len(data)):
-                pass
-
-
-def download_from_github_datum(
-    client: httpx.Client,
+    *,
+    store: CorpusStore | None = None,
+    concurrency: int = 20,
+    raw_concurrency: int = 20,
+    api_concurrency: int = 5,
+    http2: bool = True,
+    refresh: bool = False,
+) -> Counter:
+    return asyncio.run(
+        download_tomls_async(
+            output_directory=output_directory,
+            data=data,
+            github_token=github_token,
+            store=store,
+            concurrency=concurrency,
+            raw_concurrency=raw_concurrency,
+            api_concurrency=api_concurrency,
+            http2=http2,
+            refresh=refresh,
+        ),
+    )
+
+
+async def download_tomls_async(
+    output_directory: Path | None,
+    data: list[dict],
+    github_token: str | None = None,
+    *,
+    store: CorpusStore | None = None,
+    concurrency: int = 20,
+    raw_concurrency: int = 20,
+    api_concurrency: int = 5,
+    http2: bool = True,
+    refresh: bool = False,
+) -> Counter:
+    """
+    Download the files described by `data` into `output_directory`, or into `store` if given.
+
+    Files that already exist are skipped, unless `refresh` is set, in which case they are
+    re-requested conditionally (using the validators from earlier downloads), so unchanged
+    files only cost a 304 response.
+
+    Returns a counter of download outcomes.
+    """
+    if http2 and not _http2_available():
+        log.warning("HTTP/2 requested, but the `h2` package is not installed; using HTTP/1.1")
+        http2 = False
+    host_semaphores = {
+        RAW_HOST: asyncio.Semaphore(raw_concurrency),
+        API_HOST: asyncio.Semaphore(api_concurrency),
+    }
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    work = iter(data)
+    outcomes = Counter()
+
+    async def _worker(client: httpx.AsyncClient, progress: tqdm.tqdm, validators: ValidatorIndex):
+        # Workers pull from the shared iterator, so at most `concurrency` downloads are in flight.
+        for datum in work:
+            if "error" in datum:
+                outcomes["error"] += 1
+            elif "owner" in datum and "repo" in datum and "path" in datum:
+                outcomes[
+                    await download_with_retries(
+                        client=client,
+                        output_directory=output_directory,
+                        datum=datum,
+                        github_token=github_token,
+                        host_semaphores=host_semaphores,
+                        validators=validators,
+                        refresh=refresh,
+                        store=store,
+                    )
+                ] += 1
+            else:
+                print("Skipping:", datum)
+                outcomes["skipped"] += 1
+            progress.update()
+
+    if store is not None:
+        validators_path = store.path.with_name(store.path.name + VALIDATORS_FILENAME)
+    else:
+        validators_path = output_directory / VALIDATORS_FILENAME
+    with ValidatorIndex(validators_path) as validators:
+        async with httpx.AsyncClient(
+            http2=http2,
+            limits=limits,
+            event_hooks=GITHUB_RATE_LIMITER.async_event_hooks(),
+        ) as client:
+            with tqdm.tqdm(total=len(data)) as progress:
+                async with asyncio.TaskGroup() as tg:
+                    for _ in range(concurrency):
+                        tg.create_task(_worker(client, progress, validators))
+    log.info("Download outcomes: %s", ", ".join(f"{k}: {v}" for k, v in sorted(outcomes.items())))
+    return outcomes
+
+
+def _is_transient(error: httpx.HTTPError) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+async def download_with_retries(*, datum: dict, **kwargs) -> str:
+    """
+    Like `download_from_github_datum`, but retrying transient errors with exponential backoff.
+
+    Returns "failed" instead of raising if the file couldn't be downloaded.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await download_from_github_datum(datum=datum, **kwargs)
+        except httpx.HTTPError as e:
+            if attempt == MAX_RETRIES or not _is_transient(e):
+                log.error("Failed to download %s: %r", datum, e)
+                return "failed"
+            delay = RETRY_BACKOFF * 2**attempt * (1 + random.random())
+            log.warning("Retrying %s in %.1fs after %r", datum, delay, e)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def download_from_github_datum(
+    client: httpx.AsyncClient,
     output_directory: Path,
     datum: dict,
     github_token: str | None = None,
-):
-    repo = f"{datum['owner']}/{datum['repo']}"
-    storage_filename = output_directory / f"github/{repo}/{datum['path']}".replace("/", "#")
-    if storage_filename.exists():
-        log.debug("Already got: %s", storage_filename)
-        return
-    if datum.get("ref"):
-        url = f"https://raw.githubusercontent.com/{repo}/{datum['ref']}/{datum['path']}"
-        resp = client.get(url)
+    host_semaphores: dict[str, asyncio.Semaphore] | None = None,
+    validators: ValidatorIndex | None = None,
+    refresh: bool = False,
+    store: CorpusStore | None = None,
+) -> str:
+    """
+    Download a single file (into `output_directory`, or into `store` if given);
+    returns a string describing the outcome.
+    """
+    if store is not None:
+        storage_name = get_storage_name(datum)
+        exists = storage_name in store
     else:
-        url = f"https://api.github.com/repos/{repo}/contents/{datum['path']}"
-        headers = {"Accept": "application/vnd.github.raw"}
-        if github_token:
-            headers["Authorization"] = f"Bearer {github_token}"
-        resp = client.get(url, headers=headers)
+        storage_filename = get_storage_filename(output_directory, datum)
+        storage_name = storage_filename.name
+        exists = storage_filename.exists()
+    if exists and not refresh:
+        log.debug("Already got: %s", storage_name)
+        return "existing"
+    url, headers = get_download_request(datum, github_token)
+    if exists and validators:
+        headers.update(validators.get_conditional_headers(storage_name))
+    semaphore = (host_semaphores or {}).get(urlsplit(url).hostname)
+
+    async def _get() -> httpx.Response:
+        if semaphore:
+            async with semaphore:
+                return await client.get(url, headers=headers)
+        return await client.get(url, headers=headers)
+
+    resp = await GITHUB_RATE_LIMITER.send_async(_get)
+    if resp.status_code == 304:
+        log.debug("Not modified: %s", storage_name)
+        return "not-modified"
     if resp.status_code == 404:
         log.warning("Got 404 for %s (URL %s)", datum, url)
-        return
-    if resp.status_code == 200:
-        storage_filename.write_bytes(resp.content)
-        log.info("Downloaded: %s from %s", datum, url)
+        return "not-found"
     resp.raise_for_status()
+    if validators:
+        validators.update(storage_name, resp)
+    if store is not None:
+        if exists and store.get_content(storage_name) == resp.content:
+            return "unchanged"
+        store.put(datum, resp.content)
+    else:
+        if exists and storage_filename.read_bytes() == resp.content:
+            return "unchanged"
+        storage_filename.write_bytes(resp.content)
+    log.info("Downloaded: %s from %s", datum, url)
+    return "updated" if exists else "downloaded"
@@ -1,19 +1,20 @@
 from __future__ import annotations
 
-import asyncio
-import csv
+# Startup time matters (the CLI gets run thousands of times from scripts), so only what every
+# command needs is imported here; commands import the rest themselves. See `make importtime`.
+import contextlib
 import json
 import logging
 import os
 import sys
 import time
 from pathlib import Path
-from typing import TextIO
+from typing import TYPE_CHECKING, TextIO
 
 import click
 
-from ruff_usage_aggregate.actions.clean_with_repo_api import clean_with_repo_api_async
-from ruff_usage_aggregate.helpers.jsonl import read_jsonl, write_jsonl
+if TYPE_CHECKING:
+    from ruff_usage_aggregate.models import ScanResult
 
 log = logging.getLogger(__name__)
 
@@ -35,70 +36,94 @@ def main(context: click.Context, github_token: str | None, debug: bool):
 @main.command()
 @click.pass_context
 @click.option("--output-jsonl", "-o", type=click.File("a"))
-def scan_github_search(context: click.Context, output_jsonl: TextIO | None):
+@click.option(
+    "--partition/--no-partition",
+    default=True,
+    help="Split the search into queries of at most 1000 results each (by file name and size).",
+)
+@click.option("--concurrency", type=click.IntRange(min=1), default=4, help="Maximum concurrent search requests.")
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only fetch results newer than those seen in earlier runs (see --state-file), as known-tomls records.",
+)
+@click.option(
+    "--state-file",
+    type=click.Path(dir_okay=False, file_okay=True),
+    default="github-search-state.json",
+    help="Where --incremental keeps the newest results seen per query.",
+)
+def scan_github_search(
+    context: click.Context,
+    output_jsonl: TextIO | None,
+    partition: bool,
+    concurrency: int,
+    incremental: bool,
+    state_file: str,
+):
     """
-    Scan GitHub Code Search for Ruff usage; output a JSONL file of raw search results.
+    Scan GitHub Code Search for Ruff usage; output a JSONL file of raw search results
+    (or, with --incremental, of new known-tomls records).
     """
     github_token = context.obj["github_token"]
     if not github_token:
         raise ValueError("github_token is required")
-    from ruff_usage_aggregate.actions.github_search import scan_github_search
+    from ruff_usage_aggregate.actions.github_search import (
+        SearchHighWaterMarks,
+        scan_github_search,
+        scan_github_search_incremental,
+    )
+    from ruff_usage_aggregate.helpers.jsonl import write_jsonl
 
     if not output_jsonl:
-        filename = f"github_search_{int(time.time())}.jsonl"
+        filename = f"github_search_{'new_' if incremental else ''}{int(time.time())}.jsonl"
         print(f"Writing to {filename}")
         output_jsonl = open(filename, "a")
 
-    write_jsonl(output_jsonl, scan_github_search(github_token=github_token))
+    if incremental:
+        data = scan_github_search_incremental(
+            github_token=github_token,
+            high_water_marks=SearchHighWaterMarks(Path(state_file)),
+            partition=partition,
+            concurrency=concurrency,
+        )
+    else:
+        data = scan_github_search(github_token=github_token, partition=partition, concurrency=concurrency)
+    n = write_jsonl(output_jsonl, data)
+    log.info(f"Wrote {n} lines")
 
 
 @main.command()
-@click.argument("input_files", nargs=-1, type=click.File("r"))
-def combine(input_files: list[TextIO]):
+@click.argument("input_files", nargs=-1, type=click.Path(dir_okay=False, exists=True, path_type=Path))
+@click.option(
+    "--run-size",
+    type=click.IntRange(min=1),
+    help="Combine in sorted runs of at most this many records via temporary files, to bound memory use.",
+)
+def combine(input_files: list[Path], run_size: int | None):
     """
     Combine "known tomls" data.
+
+    JSONL inputs may be compressed (.jsonl.gz, .jsonl.zst).
+
+    Records are deduplicated by (owner, repo, path); where inputs disagree, later input files win,
+    but a missing ref or status never replaces a known one.
     """
-    data = []
-    for input_file in input_files:
-        if input_file.name.endswith(".csv"):
-            csv_data = list(csv.DictReader(input_file))
-            log.info(f"{input_file.name}: read {len(csv_data)} entries")
-            data.extend(csv_data)
-        elif input_file.name.endswith(".jsonl"):
-            jsonl_data = []
-            for line in read_jsonl(input_file):
-                if line.get("total_count") and line.get("items"):  # smells like a GitHub Search line
-                    for item in line["items"]:
-                        jsonl_data.append(
-                            {
-                                "owner": item["repository"]["owner"]["login"],
-                                "repo": item["repository"]["name"],
-                                "path": item["path"],
-                            },
-                        )
-                elif all(k in line for k in ("owner", "repo", "path")):
-                    jsonl_data.append(line)
-                else:
-                    log.warning(f"Unknown JSONL line: {line}")
-            log.info(f"{input_file.name}: read {len(jsonl_data)} entries")
-            data.extend(jsonl_data)
-    data.sort(key=lambda d: (d["owner"], d["repo"], d["path"]))
-
-    # See if we can find a ref for any entries that don't have one
-    for d in data:
-        if set(d) == {"owner", "repo", "path"}:
-            # Find another `d` with the same owner/repo/path, but with a ref
-            for d2 in data:
-                if (
-                    d2 is not d
-                    and d2.get("ref")
-                    and d2["owner"] == d["owner"]
-                    and d2["repo"] == d["repo"]
-                    and d2["path"] == d["path"]
-                ):
-                    d["ref"] = d2["ref"]
-                    break
+    from ruff_usage_aggregate.actions.combine import combine_records, combine_records_external, read_combine_input
+    from ruff_usage_aggregate.helpers.jsonl import write_jsonl
 
+    def _read_all():
+        for input_file in input_files:
+            n = 0
+            for record in read_combine_input(input_file):
+                n += 1
+                yield record
+            log.info(f"{input_file}: read {n} entries")
+
+    if run_size:
+        data = combine_records_external(_read_all(), run_size=run_size)
+    else:
+        data = combine_records(_read_all())
     n = write_jsonl(sys.stdout, data)
     log.info(f"Wrote {n} unique entries")
 
@@ -106,14 +131,88 @@ def combine(input_files: list[TextIO]):
 @main.command()
 @click.pass_context
 @click.option("--output-directory", "-o", type=click.Path(dir_okay=True, file_okay=False))
+@click.option(
+    "--store",
+    type=click.Path(dir_okay=False, file_okay=True),
+    help="Download into a single-file corpus store instead of a directory.",
+)
+@click.option("--concurrency", type=click.IntRange(min=1), default=20, help="Maximum concurrent downloads.")
+@click.option(
+    "--raw-concurrency",
+    type=click.IntRange(min=1),
+    default=20,
+    help="Maximum concurrent requests to raw.githubusercontent.com.",
+)
+@click.option(
+    "--api-concurrency",
+    type=click.IntRange(min=1),
+    default=5,
+    help="Maximum concurrent requests to api.github.com.",
+)
+@click.option("--http2/--no-http2", default=True, help="Use HTTP/2 (requires the `http2` extra).")
+@click.option(
+    "--refresh/--no-refresh",
+    default=False,
+    help="Re-request already downloaded files with conditional requests, updating any that changed.",
+)
+@click.option(
+    "--input-jsonl",
+    "-i",
+    type=click.Path(dir_okay=False, file_okay=True, exists=True, path_type=Path),
+    help="Read the known TOMLs JSONL from this file instead of stdin.",
+)
+@click.option(
+    "--sample",
+    type=click.IntRange(min=1),
+    help="Only download a random sample of this many records (requires an uncompressed --input-jsonl).",
+)
+@click.option("--seed", type=int, help="Random seed for --sample.")
 def download_tomls(
     context: click.Context,
     output_directory: str | None,
+    store: str | None,
+    concurrency: int,
+    raw_concurrency: int,
+    api_concurrency: int,
+    http2: bool,
+    refresh: bool,
+    input_jsonl: Path | None,
+    sample: int | None,
+    seed: int | None,
 ):
     """
-    Download TOMLs from a known TOMLs JSONL (from stdin).
+    Download TOMLs from a known TOMLs JSONL (from stdin, or --input-jsonl).
     """
     from ruff_usage_aggregate.actions.toml_download import download_tomls
+    from ruff_usage_aggregate.helpers.jsonl import MappedJSONL, read_jsonl
+
+    if sample:
+        if not input_jsonl or input_jsonl.suffix != ".jsonl":
+            raise click.UsageError("--sample requires an uncompressed --input-jsonl file")
+        # Only the sampled records are parsed, not the whole file.
+        with MappedJSONL(input_jsonl) as mapped:
+            data = mapped.sample(sample, seed=seed)
+        log.info(f"Sampled {len(data)} of {len(mapped)} records")
+    else:
+        data = list(read_jsonl(input_jsonl or sys.stdin))
+
+    download_kwargs = {
+        "data": data,
+        "github_token": context.obj["github_token"],
+        "concurrency": concurrency,
+        "raw_concurrency": raw_concurrency,
+        "api_concurrency": api_concurrency,
+        "http2": http2,
+        "refresh": refresh,
+    }
+    if store:
+        if output_directory:
+            raise click.UsageError("--output-directory and --store are mutually exclusive")
+        from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+
+        with CorpusStore(Path(store)) as corpus_store:
+            download_tomls(output_directory=None, store=corpus_store, **download_kwargs)
+        return
 
     if not output_directory:
         output_directory = f"./tomls_{int(time.time())}"
@@ -121,54 +220,220 @@ def download_tomls(
 
     os.makedirs(output_directory, exist_ok=True)
 
-    download_tomls(
-        output_directory=Path(output_directory),
-        data=list(read_jsonl(sys.stdin)),
-        github_token=context.obj["github_token"],
-    )
+    download_tomls(output_directory=Path(output_directory), **download_kwargs)
 
 
 @main.command()
-@click.option("--input-directory", "-i", type=click.Path(dir_okay=True, file_okay=False, exists=True))
-@click.option("--output-format", "-o", type=click.Choice(["json", "markdown"]), required=True)
-def scan_tomls(input_directory: str, output_format: str):
+@click.option("--input-directory", "-i", type=click.Path(dir_okay=True, file_okay=False, exists=True), required=True)
+@click.option("--store", type=click.Path(dir_okay=False, file_okay=True), required=True)
+def pack_tomls(input_directory: str, store: str):
     """
-    Scan downloaded TOML files for Ruff usage.
+    Import a directory of downloaded TOML files into a single-file corpus store.
     """
-    from ruff_usage_aggregate.actions.scan_tomls import scan_tomls
+    from ruff_usage_aggregate.helpers.corpus_store import CorpusStore, import_directory
+
+    with CorpusStore(Path(store)) as corpus_store:
+        n = import_directory(corpus_store, Path(input_directory))
+        log.info(f"Imported {n} files; {store} now has {len(corpus_store)} files ({corpus_store.n_blobs} unique)")
 
-    sr = scan_tomls(input_directory=Path(input_directory))
+
+def _parse_shard(context: click.Context, param: click.Parameter, value: str | None) -> tuple[int, int] | None:
+    if not value:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise click.BadParameter("expected INDEX/COUNT, e.g. 0/4") from None
+    if not (count > 0 and 0 <= index < count):
+        raise click.BadParameter("expected 0 <= INDEX < COUNT")
+    return (index, count)
+
+
+def _print_scan_result(sr: ScanResult, output_format: str) -> None:
     if output_format == "json":
-        sorted_value_sets = {
-            key: [(sorted(c_key), value) for c_key, value in counter.most_common()]
-            for key, counter in sr.value_set_counters.items()
-        }
-        jsonable = {
-            "aggregate": sr.aggregated_data,
-            "value_sets": sorted_value_sets,
-        }
-        print(json.dumps(jsonable, indent=2))
+        from ruff_usage_aggregate.format.jsonable import format_json
+
+        print(format_json(sr))
     elif output_format == "markdown":
         from ruff_usage_aggregate.format.markdown import format_markdown
 
         print(format_markdown(sr))
 
 
+@main.command()
+@click.option("--input-directory", "-i", type=click.Path(dir_okay=True, file_okay=False, exists=True))
+@click.option(
+    "--store",
+    type=click.Path(dir_okay=False, file_okay=True, exists=True),
+    help="Scan a corpus store instead of a directory.",
+)
+@click.option("--output-format", "-o", type=click.Choice(["json", "markdown", "partial"]), required=True)
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1, help="Number of parallel parser processes.")
+@click.option("--cache/--no-cache", default=False, help="Use a persistent parse cache.")
+@click.option(
+    "--cache-file",
+    type=click.Path(dir_okay=False, file_okay=True),
+    help="Parse cache location (default: next to the input directory or store).",
+)
+@click.option("--shard", callback=_parse_shard, help="Only scan shard INDEX/COUNT of the files (e.g. 0/4).")
+@click.option(
+    "--backend",
+    type=click.Choice(["python", "numpy"]),
+    default="python",
+    help="Aggregation backend; numpy requires the `histogram` extra.",
+)
+def scan_tomls(
+    input_directory: str | None,
+    store: str | None,
+    output_format: str,
+    jobs: int,
+    cache: bool,
+    cache_file: str | None,
+    shard: tuple[int, int] | None,
+    backend: str,
+):
+    """
+    Scan downloaded TOML files for Ruff usage.
+
+    The "partial" output format writes a partial aggregate that can be combined with others
+    using `merge-aggregates`.
+    """
+    from ruff_usage_aggregate.actions.scan_tomls import scan_tomls
+    from ruff_usage_aggregate.models import Aggregator
+
+    if bool(input_directory) == bool(store):
+        raise click.UsageError("Exactly one of --input-directory and --store is required")
+    if backend == "numpy":
+        if output_format == "partial":
+            raise click.UsageError("The numpy backend can't write partial aggregates")
+        from ruff_usage_aggregate.columnar import ColumnarAggregator
+
+        aggregator = ColumnarAggregator()
+    elif output_format == "partial":
+        aggregator = Aggregator.mergeable()
+    else:
+        aggregator = Aggregator()
+    scan_kwargs = {
+        "input_directory": Path(input_directory) if input_directory else None,
+        "jobs": jobs,
+        "shard": shard,
+        "aggregator": aggregator,
+    }
+    with contextlib.ExitStack() as stack:
+        if store:
+            from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+
+            scan_kwargs["store"] = stack.enter_context(CorpusStore(Path(store)))
+        if cache or cache_file:
+            from ruff_usage_aggregate.helpers.scan_cache import ScanCache, get_default_cache_path
+
+            cache_path = Path(cache_file) if cache_file else get_default_cache_path(Path(input_directory or store))
+            scan_kwargs["cache"] = stack.enter_context(ScanCache(cache_path))
+        sr = scan_tomls(**scan_kwargs)
+    if output_format == "partial":
+        print(json.dumps(aggregator.to_dict(), sort_keys=True))
+    else:
+        _print_scan_result(sr, output_format)
+
+
+@main.command()
+@click.argument("partial_files", nargs=-1, type=click.File("r"), required=True)
+@click.option("--output-format", "-o", type=click.Choice(["json", "markdown", "partial"]), required=True)
+def merge_aggregates(partial_files: list[TextIO], output_format: str):
+    """
+    Merge partial aggregates written by `scan-tomls -o partial` (e.g. run over shards).
+    """
+    from ruff_usage_aggregate.models import Aggregator
+
+    aggregator = Aggregator.mergeable()
+    for partial_file in partial_files:
+        aggregator.merge(Aggregator.from_dict(json.load(partial_file)))
+        log.info(f"{partial_file.name}: merged, {aggregator.n_total} files so far")
+    if output_format == "partial":
+        print(json.dumps(aggregator.to_dict(), sort_keys=True))
+    else:
+        _print_scan_result(aggregator.result(), output_format)
+
+
+@main.command()
+@click.option("--input-directory", "-i", type=click.Path(dir_okay=True, file_okay=False, exists=True))
+@click.option(
+    "--store",
+    type=click.Path(dir_okay=False, file_okay=True, exists=True),
+    help="Invalidate the cache of a corpus store scan instead of a directory scan.",
+)
+@click.option(
+    "--cache-file",
+    type=click.Path(dir_okay=False, file_okay=True),
+    help="Parse cache location (default: next to the input directory or store).",
+)
+@click.option("--all/--stale", "evict_all", default=False, help="Evict everything, or only stale entries.")
+def invalidate_scan_cache(input_directory: str | None, store: str | None, cache_file: str | None, evict_all: bool):
+    """
+    Evict removed or changed files (or everything) from the scan-tomls parse cache.
+    """
+    from ruff_usage_aggregate.helpers.scan_cache import ScanCache, get_default_cache_path
+
+    if bool(input_directory) == bool(store):
+        raise click.UsageError("Exactly one of --input-directory and --store is required")
+    cache_path = Path(cache_file) if cache_file else get_default_cache_path(Path(input_directory or store))
+    if not cache_path.is_file():
+        log.info(f"No scan cache at {cache_path}")
+        return
+    with ScanCache(cache_path) as scan_cache:
+        if evict_all:
+            n_files, n_configs = scan_cache.invalidate()
+        elif store:
+            from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+
+            with CorpusStore(Path(store)) as corpus_store:
+                n_files, n_configs = scan_cache.invalidate(store=corpus_store)
+        else:
+            n_files, n_configs = scan_cache.invalidate(Path(input_directory))
+    log.info(f"Evicted {n_files} files and {n_configs} configs from {cache_path}")
+
+
 @main.command()
 @click.pass_context
 @click.argument("known_github_tomls", type=click.Path(dir_okay=False, file_okay=True, exists=True))
 @click.argument("known_github_tomls_no_forks", type=click.Path(dir_okay=False, file_okay=True))
 @click.argument("repo_api_data", type=click.Path(dir_okay=False, file_okay=True, exists=True))
+@click.option(
+    "--max-age-days",
+    type=click.FloatRange(min=0),
+    help="Re-query repositories whose cached API data is older than this (default: never).",
+)
+@click.option(
+    "--api",
+    type=click.Choice(["rest", "graphql"]),
+    default="rest",
+    help="Query repositories one REST request at a time, or in batched GraphQL requests.",
+)
+@click.option(
+    "--graphql-batch-size",
+    type=click.IntRange(min=1, max=100),
+    default=50,
+    help="Repositories per GraphQL request.",
+)
+@click.option("--concurrency", type=click.IntRange(min=1), default=50, help="Maximum concurrent requests.")
 def clean_with_repo_api(
     context: click.Context,
     known_github_tomls: str,
     known_github_tomls_no_forks: str,
     repo_api_data: str,
+    max_age_days: float | None,
+    api: str,
+    graphql_batch_size: int,
+    concurrency: int,
 ):
     """
     Remove the forks from known-github-tomls.jsonl by querying the GitHub api and writing the result to
     known-github-tomls-clean.jsonl. The GitHub api results are saved to repo_api_data.jsonl to avoid the rate limit.
     """
+    import asyncio
+
+    from ruff_usage_aggregate.actions.clean_with_repo_api import clean_with_repo_api_async
+
     github_token = context.obj["github_token"]
     asyncio.run(
         clean_with_repo_api_async(
@@ -176,5 +441,189 @@ def clean_with_repo_api(
             Path(known_github_tomls_no_forks),
             Path(repo_api_data),
             github_token,
+            max_age=max_age_days * 86400 if max_age_days is not None else None,
+            graphql_batch_size=graphql_batch_size if api == "graphql" else None,
+            concurrency=concurrency,
         ),
     )
+
+
+@main.command()
+@click.pass_context
+@click.option("--work-dir", "-w", type=click.Path(dir_okay=True, file_okay=False), default="pipeline")
+@click.option(
+    "--known-tomls",
+    type=click.Path(dir_okay=False, file_okay=True, exists=True),
+    default="data/known-github-tomls.jsonl",
+)
+@click.option("--repo-api-data", type=click.Path(dir_okay=False, file_okay=True), default="data/repo_api_data.jsonl")
+@click.option("--search/--no-search", default=True, help="Search GitHub for new TOMLs (requires a GitHub token).")
+@click.option("--clean/--no-clean", default=True, help="Remove forks using the GitHub API (requires a GitHub token).")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=1, help="Number of parallel parser processes.")
+@click.option("--parallel-stages", type=click.IntRange(min=1), default=2, help="Maximum stages to run at once.")
+@click.option(
+    "--force",
+    multiple=True,
+    type=click.Choice(["search", "combine", "download", "clean", "scan"]),
+    help="Rerun a stage even if it's up to date.",
+)
+def run_pipeline(
+    context: click.Context,
+    work_dir: str,
+    known_tomls: str,
+    repo_api_data: str,
+    search: bool,
+    clean: bool,
+    jobs: int,
+    parallel_stages: int,
+    force: tuple[str, ...],
+):
+    """
+    Run the whole workflow (search, combine, download, clean, scan) in a work directory.
+
+    Finished stages are recorded in a manifest in the work directory, so an interrupted
+    run can be resumed by running the same command again.
+    """
+    from ruff_usage_aggregate.actions.pipeline import (
+        MANIFEST_FILENAME,
+        PipelineManifest,
+        get_pipeline_stages,
+        run_pipeline,
+    )
+
+    github_token = context.obj["github_token"]
+    if not github_token and (search or clean):
+        log.warning("No GitHub token; skipping the search and clean stages")
+        search = clean = False
+    work_path = Path(work_dir)
+    work_path.mkdir(parents=True, exist_ok=True)
+    stages = get_pipeline_stages(
+        work_path,
+        known_tomls=Path(known_tomls),
+        repo_api_data=Path(repo_api_data),
+        github_token=github_token,
+        search=search,
+        clean=clean,
+        jobs=jobs,
+    )
+    run_pipeline(
+        stages,
+        PipelineManifest(work_path / MANIFEST_FILENAME),
+        max_parallel=parallel_stages,
+        force=frozenset(force),
+    )
+
+
+def _probe_options(f):
+    """
+    Options shared by the commands that probe repositories for Ruff configuration files.
+    """
+    for option in reversed(
+        [
+            click.option(
+                "--known-jsonl",
+                multiple=True,
+                type=click.Path(dir_okay=False, file_okay=True, exists=True, path_type=Path),
+                help="Skip repositories in this known-tomls style JSONL file (may be repeated).",
+            ),
+            click.option(
+                "--negative-cache",
+                type=click.Path(dir_okay=False, file_okay=True, path_type=Path),
+                default="probe-negative-cache.jsonl",
+                help="Where to remember repositories in which nothing was found.",
+            ),
+            click.option(
+                "--negative-cache-ttl-days",
+                type=click.FloatRange(min=0),
+                default=30,
+                help="Re-probe repositories in which nothing was found after this long.",
+            ),
+            click.option(
+                "--concurrency",
+                type=click.IntRange(min=1),
+                default=20,
+                help="Maximum repositories probed at once.",
+            ),
+        ],
+    ):
+        f = option(f)
+    return f
+
+
+@main.command()
+@_probe_options
+def probe_repos(known_jsonl: tuple[Path, ...], negative_cache: Path, negative_cache_ttl_days: float, concurrency: int):
+    """
+    Probe repositories (owner/repo names or JSON objects, from stdin) for Ruff configuration files,
+    writing known-tomls JSONL records to stdout.
+    """
+    import asyncio
+
+    from ruff_usage_aggregate.actions.probe_repos import (
+        ProbeNegativeCache,
+        get_known_repos,
+        parse_repo_line,
+        probe_repos_async,
+    )
+
+    known_repos = get_known_repos(known_jsonl)
+    log.info(f"Ignoring {len(known_repos)} known repositories")
+
+    def _emit(datum: dict) -> None:
+        print(json.dumps(datum, sort_keys=True), flush=True)
+
+    with ProbeNegativeCache(negative_cache, ttl=negative_cache_ttl_days * 86400) as cache:
+        asyncio.run(
+            probe_repos_async(
+                (parse_repo_line(line) for line in sys.stdin if line.strip()),
+                emit=_emit,
+                known_repos=known_repos,
+                negative_cache=cache,
+                concurrency=concurrency,
+            ),
+        )
+
+
+@main.command()
+@_probe_options
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, file_okay=True, path_type=Path),
+    default="dependents-checkpoint.json",
+    help="Where to save the page to resume scraping from.",
+)
+@click.option("--restart/--resume", default=False, help="Start from the first page even if a scrape was interrupted.")
+def scrape_dependents(
+    known_jsonl: tuple[Path, ...],
+    negative_cache: Path,
+    negative_cache_ttl_days: float,
+    concurrency: int,
+    checkpoint: Path,
+    restart: bool,
+):
+    """
+    Scrape the Ruff repository's GitHub dependents page and probe the dependents for Ruff configuration files,
+    writing known-tomls JSONL records to stdout.
+    """
+    import asyncio
+
+    from ruff_usage_aggregate.actions.probe_repos import ProbeNegativeCache, get_known_repos
+    from ruff_usage_aggregate.actions.scrape_dependents import DependentsCheckpoint, scrape_dependents_async
+
+    known_repos = get_known_repos(known_jsonl)
+    log.info(f"Ignoring {len(known_repos)} known repositories")
+
+    def _emit(datum: dict) -> None:
+        print(json.dumps(datum, sort_keys=True), flush=True)
+
+    with ProbeNegativeCache(negative_cache, ttl=negative_cache_ttl_days * 86400) as cache:
+        asyncio.run(
+            scrape_dependents_async(
+                checkpoint=DependentsCheckpoint(checkpoint),
+                emit=_emit,
+                known_repos=known_repos,
+                negative_cache=cache,
+                concurrency=concurrency,
+                restart=restart,
+            ),
+        )
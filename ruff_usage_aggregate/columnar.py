@@ -0,0 +1,156 @@
+"""Columnar aggregation backend using NumPy (install the `histogram` extra).
+
+Unique configs are stored as columns (a line-length array, a categorical target version,
+and a sparse config × value incidence matrix per set field) and the counters of a
+`ScanResult` are computed with array operations when the result is requested.
+"""
+
+from __future__ import annotations
+
+import array
+from collections import Counter
+
+import numpy as np
+
+from ruff_usage_aggregate.constants import UNSET
+from ruff_usage_aggregate.helpers.vocabulary import Vocabulary
+from ruff_usage_aggregate.models import (
+    AGGREGATED_DATA_KEYS,
+    AGGREGATED_SET_FIELDS,
+    VALUE_SET_FIELDS,
+    RuffConfig,
+    ScanResult,
+)
+
+
+class _IncidenceColumn:
+    """
+    A sparse (row, value) incidence matrix, plus a per-row flag for whether the field was set at all.
+    """
+
+    def __init__(self) -> None:
+        self.rows = array.array("q")
+        self.cols = array.array("q")
+        self.is_set = array.array("b")
+
+    def append(self, row: int, cols: list[int] | None) -> None:
+        self.is_set.append(cols is not None)
+        if cols:
+            self.rows.extend([row] * len(cols))
+            self.cols.extend(cols)
+
+    def item_counts(self, vocabulary: Vocabulary) -> Counter:
+        # A config counts as "unset" for the item counts if the field is missing or empty.
+        counter = Counter()
+        n_rows = len(self.is_set)
+        cols = np.frombuffer(self.cols, dtype=np.int64)
+        for index, count in enumerate(np.bincount(cols, minlength=len(vocabulary)).tolist()):
+            if count:
+                counter[vocabulary.value(index)] = count
+        n_nonempty = len(np.unique(np.frombuffer(self.rows, dtype=np.int64)))
+        if n_rows - n_nonempty:
+            counter[UNSET] = n_rows - n_nonempty
+        return counter
+
+    def value_set_counts(self, vocabulary: Vocabulary) -> Counter:
+        n_rows = len(self.is_set)
+        is_set = np.frombuffer(self.is_set, dtype=np.int8).astype(bool)
+        rows = np.frombuffer(self.rows, dtype=np.int64)
+        cols = np.frombuffer(self.cols, dtype=np.int64)
+        # Pack each row's values into bytes (as `np.packbits` would), so identical sets become identical rows.
+        packed = np.zeros((n_rows, max(1, (len(vocabulary) + 7) // 8)), dtype=np.uint8)
+        np.bitwise_or.at(packed, (rows, cols // 8), (0x80 >> (cols % 8)).astype(np.uint8))
+        counter = Counter()
+        if is_set.any():
+            unique_rows, counts = np.unique(packed[is_set], axis=0, return_counts=True)
+            for unique_row, count in zip(unique_rows, counts.tolist(), strict=True):
+                indices = np.flatnonzero(np.unpackbits(unique_row))
+                counter[frozenset(vocabulary.value(index) for index in indices.tolist())] = count
+        if n_unset := int((~is_set).sum()):
+            counter[UNSET] = n_unset
+        return counter
+
+
+class ColumnarAggregator:
+    """
+    A drop-in replacement for `Aggregator` (without merging support) that defers counting to NumPy.
+    """
+
+    def __init__(self) -> None:
+        self.n_total = 0
+        self.seen_hashes: set[str | None] = set()
+        self.vocabulary = Vocabulary()
+        self.line_lengths = array.array("q")
+        self.line_length_is_set = array.array("b")
+        self.target_versions = array.array("q")
+        self.columns = {key: _IncidenceColumn() for key in (*VALUE_SET_FIELDS, "per_file_ignores")}
+
+    def _encode(self, values) -> list[int] | None:
+        if values is None:
+            return None
+        index = self.vocabulary.index
+        return [index(value) for value in values]
+
+    def add(self, config: RuffConfig, count: int = 1) -> None:
+        self.n_total += count
+        if config.text_hash in self.seen_hashes:
+            return
+        self.seen_hashes.add(config.text_hash)
+        row = len(self.seen_hashes) - 1
+        columns = self.columns
+        for key, values in (
+            ("extend_ignore", config.extend_ignore),
+            ("extend_select", config.extend_select),
+            ("fields_set", config.fields_set),
+            ("fixable", config.fixable),
+            ("ignore", config.ignore),
+            ("select", config.select),
+            ("unfixable", config.unfixable),
+        ):
+            columns[key].append(row, self._encode(values))
+        if config.per_file_ignores is not None:
+            pfi_values = [value for ignores in config.per_file_ignores.values() for value in ignores]
+            columns["per_file_ignores"].append(row, self._encode(pfi_values))
+        else:
+            columns["per_file_ignores"].append(row, None)
+        self.line_lengths.append(config.line_length if config.line_length is not None else 0)
+        self.line_length_is_set.append(config.line_length is not None)
+        self.target_versions.append(self.vocabulary.index(config.target_version or UNSET))
+
+    def _line_length_counters(self) -> tuple[Counter, Counter]:
+        line_lengths = np.frombuffer(self.line_lengths, dtype=np.int64)
+        is_set = np.frombuffer(self.line_length_is_set, dtype=np.int8).astype(bool)
+        values, counts = np.unique(line_lengths[is_set], return_counts=True)
+        line_lengths_counter = Counter(dict(zip(values.tolist(), counts.tolist(), strict=True)))
+        # In the aggregated data, a zero line length counts as unset, just like in `Aggregator`.
+        aggregated_counter = Counter({value: count for value, count in line_lengths_counter.items() if value})
+        if n_unset := len(line_lengths) - aggregated_counter.total():
+            aggregated_counter[UNSET] = n_unset
+        return aggregated_counter, line_lengths_counter
+
+    def _target_version_counter(self) -> Counter:
+        codes = np.frombuffer(self.target_versions, dtype=np.int64)
+        values, counts = np.unique(codes, return_counts=True)
+        value = self.vocabulary.value
+        return Counter({value(code): count for code, count in zip(values.tolist(), counts.tolist(), strict=True)})
+
+    def result(self) -> ScanResult:
+        aggregated_line_lengths, line_lengths = self._line_length_counters()
+        aggregated_data = {}
+        for key in AGGREGATED_DATA_KEYS:
+            if key == "line_length":
+                aggregated_data[key] = aggregated_line_lengths
+            elif key == "target_version":
+                aggregated_data[key] = self._target_version_counter()
+            else:
+                aggregated_data[key] = self.columns[key].item_counts(self.vocabulary)
+                if key not in AGGREGATED_SET_FIELDS:
+                    # `per_file_ignores` and `fields_set` are plain item counts with no "unset" count.
+                    aggregated_data[key].pop(UNSET, None)
+        return ScanResult.from_counters(
+            n_total=self.n_total,
+            n_unique=len(self.seen_hashes),
+            aggregated_data=aggregated_data,
+            value_set_counters={key: self.columns[key].value_set_counts(self.vocabulary) for key in VALUE_SET_FIELDS},
+            line_lengths=line_lengths,
+        )
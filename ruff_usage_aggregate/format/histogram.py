@@ -1,20 +1,28 @@
-import statistics
 from collections import Counter
 from io import StringIO
 
 from ruff_usage_aggregate.format.helpers import format_bar, format_markdown_table
+from ruff_usage_aggregate.helpers.stats import counter_mean, counter_median, counter_mode, counter_quantile
 
 
 def format_stats_and_histogram(sio: StringIO, counter: Counter, bar_width=20, bins=10):
-    flat_counter = [value for value, count in counter.items() for _ in range(count)]
-    mean = statistics.mean(flat_counter)
-    median = statistics.median(flat_counter)
+    # Everything here is computed from the (value, count) pairs, so memory use is proportional
+    # to the number of distinct values, not the number of occurrences.
+    total = counter.total()
+    mean = counter_mean(counter)
+    median = counter_median(counter)
     print(f"Mean: {mean:.2f} / Median: {median:.2f}", file=sio)
     print(file=sio)
+    p90 = counter_quantile(counter, 0.9)
+    p99 = counter_quantile(counter, 0.99)
+    mode = counter_mode(counter)
+    print(f"Mode: {mode} / P90: {p90:.2f} / P99: {p99:.2f}", file=sio)
+    print(file=sio)
     try:
         import numpy
 
-        counts, edges = numpy.histogram(flat_counter, bins=bins)
+        values = sorted(counter)
+        counts, edges = numpy.histogram(values, bins=bins, weights=[counter[value] for value in values])
         max_count = max(counts)
         print("## Histogram\n", file=sio)
         headers = ["Bin", "Count", "%", "Bar"]
@@ -25,7 +33,7 @@ def format_stats_and_histogram(sio: StringIO, counter: Counter, bar_width=20, bi
                 [
                     f"{edge:.0f}..{next_edge:.0f}",
                     count,
-                    f"{count / len(flat_counter):.1%}",
+                    f"{count / total:.1%}",
                     format_bar(count, max_count, bar_width),
                 ],
             )
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import json
+
+from ruff_usage_aggregate.models import ScanResult
+
+
+def format_json(sr: ScanResult) -> str:
+    sorted_value_sets = {
+        key: [(sorted(c_key), value) for c_key, value in counter.most_common()]
+        for key, counter in sr.value_set_counters.items()
+    }
+    jsonable = {
+        "aggregate": sr.aggregated_data,
+        "value_sets": sorted_value_sets,
+    }
+    return json.dumps(jsonable, indent=2)
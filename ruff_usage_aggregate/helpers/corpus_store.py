@@ -0,0 +1,193 @@
+"""Single-file TOML corpus store.
+
+An alternative to keeping one file per downloaded TOML (named `github#owner#repo#path`):
+the contents are kept in a SQLite database, keyed by owner/repo/path/ref, so downloading
+and scanning don't pay for hundreds of thousands of filesystem metadata operations.
+
+Many repositories share identical files, so contents are stored (and scanned) only once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import pathlib
+import sqlite3
+from collections.abc import Iterable
+
+log = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+# Writes are committed in batches of this many files.
+COMMIT_INTERVAL = 500
+
+
+def get_storage_name(datum: dict) -> str:
+    """
+    Get the name a downloaded file is stored under (a filename, when storing to a directory).
+    """
+    return f"github/{datum['owner']}/{datum['repo']}/{datum['path']}".replace("/", "#")
+
+
+def parse_storage_name(name: str) -> dict:
+    """
+    Parse a name generated by `get_storage_name` back into owner, repo and path.
+
+    Since slashes are replaced, the path is ambiguous if it contained a `#` to begin with.
+    """
+    source, owner, repo, path = name.split("#", 3)
+    if source != "github":
+        raise ValueError(f"Unexpected storage name: {name!r}")
+    return {"owner": owner, "repo": repo, "path": path.replace("#", "/")}
+
+
+def decode_toml(content: bytes) -> str:
+    """
+    Decode downloaded TOML content like reading the file as text would (including newline translation).
+    """
+    return content.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def get_text_hash(content: bytes) -> str:
+    """
+    Get the hash `scan-tomls` knows the content by (the hash of the decoded text, or of the raw bytes
+    if it isn't valid UTF-8).
+    """
+    try:
+        content = decode_toml(content).encode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    return hashlib.sha256(content).hexdigest()
+
+
+class CorpusStore:
+    """
+    Downloaded files, stored content-addressed: each unique content is stored once as a blob
+    (keyed by its SHA-256), and a manifest maps each file to its blob.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self._n_uncommitted = 0
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        if version > STORE_VERSION:
+            raise ValueError(f"{self.path}: unsupported corpus store version {version}")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                content BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS manifest (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                path TEXT NOT NULL,
+                ref TEXT,
+                content_hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS manifest_repo ON manifest (owner, repo, path, ref);
+            CREATE INDEX IF NOT EXISTS manifest_content_hash ON manifest (content_hash);
+            """,
+        )
+        self.db.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self) -> CorpusStore:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+
+    def __contains__(self, name: str) -> bool:
+        return bool(self.db.execute("SELECT 1 FROM manifest WHERE name = ?", (name,)).fetchone())
+
+    @property
+    def n_blobs(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+    def get_content(self, name: str) -> bytes | None:
+        row = self.db.execute(
+            "SELECT content FROM manifest JOIN blobs USING (content_hash) WHERE name = ?",
+            (name,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_blobs(self, content_hashes: list[str]) -> list[bytes]:
+        """
+        Get the contents of the given blobs, in the given order.
+        """
+        placeholders = ", ".join("?" * len(content_hashes))
+        contents = dict(
+            self.db.execute(
+                f"SELECT content_hash, content FROM blobs WHERE content_hash IN ({placeholders})",
+                content_hashes,
+            ),
+        )
+        return [contents[content_hash] for content_hash in content_hashes]
+
+    def iter_index(self) -> Iterable[tuple[str, str, str]]:
+        """
+        Iterate over (name, content hash, text hash) of all stored files, ordered by name.
+        """
+        return self.db.execute(
+            "SELECT name, content_hash, text_hash FROM manifest JOIN blobs USING (content_hash) ORDER BY name",
+        ).fetchall()
+
+    def put(self, datum: dict, content: bytes) -> None:
+        """
+        Store the contents of the file described by `datum` (a known-tomls record).
+        """
+        name = get_storage_name(datum)
+        content_hash = hashlib.sha256(content).hexdigest()
+        old_row = self.db.execute("SELECT content_hash FROM manifest WHERE name = ?", (name,)).fetchone()
+        self.db.execute(
+            "INSERT OR IGNORE INTO blobs (content_hash, text_hash, content) VALUES (?, ?, ?)",
+            (content_hash, get_text_hash(content), content),
+        )
+        self.db.execute(
+            "INSERT OR REPLACE INTO manifest (name, owner, repo, path, ref, content_hash) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, datum["owner"], datum["repo"], datum["path"], datum.get("ref"), content_hash),
+        )
+        if old_row and old_row[0] != content_hash:
+            # Drop the previous contents if nothing else refers to them anymore.
+            self.db.execute(
+                "DELETE FROM blobs WHERE content_hash = ? "
+                "AND NOT EXISTS (SELECT 1 FROM manifest WHERE content_hash = ?)",
+                (old_row[0], old_row[0]),
+            )
+        self._n_uncommitted += 1
+        if self._n_uncommitted >= COMMIT_INTERVAL:
+            self.db.commit()
+            self._n_uncommitted = 0
+
+
+def import_directory(store: CorpusStore, input_directory: pathlib.Path) -> int:
+    """
+    Import a directory of downloaded TOML files into a corpus store; returns the number of files imported.
+    """
+    n = 0
+    for pth in input_directory.glob("*.toml"):
+        try:
+            datum = parse_storage_name(pth.name)
+        except ValueError:
+            log.warning(f"Skipping {pth}: not a downloaded file name")
+            continue
+        store.put(datum, pth.read_bytes())
+        n += 1
+    return n
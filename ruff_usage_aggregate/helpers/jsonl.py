@@ -1,28 +1,105 @@
 from __future__ import annotations
 
+import array
 import contextlib
+import gzip
 import json
+import mmap
+import os
 import pathlib
-from collections.abc import Iterable
-from typing import IO
+import random
+from collections.abc import Callable, Iterable, Iterator
+from typing import IO, Any
+
+# Lines are written out in batches of about this many characters.
+WRITE_BATCH_SIZE = 65536
+
+# Writing always uses the stdlib encoder, since the faster libraries format JSON differently
+# (e.g. without spaces after separators), and data files shouldn't churn depending on what's installed.
+# Reusing one encoder also avoids `json.dumps` constructing a new one for every line.
+_encode = json.JSONEncoder(sort_keys=True, ensure_ascii=False).encode
+
+
+def _get_backend() -> str:
+    """
+    Figure out which JSON library to decode with: the `RUA_JSON_BACKEND` environment variable,
+    or the fastest one installed.
+    """
+    if backend := os.environ.get("RUA_JSON_BACKEND"):
+        return backend
+    for backend in ("orjson", "msgspec"):
+        try:
+            __import__(backend)
+        except ImportError:
+            continue
+        return backend
+    return "json"
+
+
+JSON_BACKEND = _get_backend()
+
+
+def _get_loads(record_type: type | None) -> Callable[[str], Any]:
+    if JSON_BACKEND == "msgspec":
+        import msgspec
+
+        return msgspec.json.Decoder(record_type).decode if record_type else msgspec.json.decode
+    if JSON_BACKEND == "orjson":
+        import orjson
+
+        loads = orjson.loads
+    else:
+        loads = json.loads
+    if record_type:
+        return lambda line: record_type(**loads(line))
+    return loads
 
 
 def write_jsonl(dest: pathlib.Path | IO, data: Iterable[dict]) -> int:
     last_line = None
     n = 0
+    batch = []
+    batch_size = 0
     with _open_or_enter(dest, "w") as f:
         for datum in data:
-            line = json.dumps(datum, sort_keys=True, ensure_ascii=False)
+            line = _encode(datum)
             if line != last_line:
-                print(line, file=f)
+                batch.append(line)
+                batch_size += len(line)
                 n += 1
                 last_line = line
+                if batch_size >= WRITE_BATCH_SIZE:
+                    f.write("\n".join(batch) + "\n")
+                    batch.clear()
+                    batch_size = 0
+        if batch:
+            f.write("\n".join(batch) + "\n")
     return n
 
 
+def is_jsonl_filename(name: str) -> bool:
+    return name.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst"))
+
+
+def open_maybe_compressed(path: str | pathlib.Path, mode: str) -> IO:
+    """
+    Open a file in text mode, transparently (de)compressing it if it's named `.gz` or `.zst`.
+    """
+    path = pathlib.Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    if path.suffix == ".zst":
+        try:
+            import zstandard
+        except ImportError as ie:
+            raise ImportError(f"The `zstandard` package (`zstd` extra) is required to open {path}") from ie
+        return zstandard.open(path, f"{mode}t", encoding="utf-8")
+    return path.open(mode)
+
+
 def _open_or_enter(dest, mode: str):
     if isinstance(dest, str | pathlib.Path):
-        return pathlib.Path(dest).open(mode)
+        return open_maybe_compressed(dest, mode)
     return contextlib.nullcontext(dest)
 
 
@@ -30,10 +107,76 @@ def _error(line: str) -> dict:
     raise ValueError(f"Invalid JSONL line: {line!r}")
 
 
-def read_jsonl(dest: pathlib.Path | IO, converter=_error) -> Iterable[dict]:
+def read_jsonl(dest: pathlib.Path | IO, converter=_error, *, record_type: type | None = None) -> Iterable[Any]:
+    """
+    Read a JSONL file, yielding dicts (or instances of `record_type`, e.g. a dataclass, if given).
+
+    Lines that don't look like JSON objects are passed to `converter`.
+    """
+    loads = _get_loads(record_type)
     with _open_or_enter(dest, "r") as f:
         for line in f:
             if line.startswith("{"):
-                yield json.loads(line)
+                yield loads(line)
             else:
                 yield converter(line)
+
+
+class MappedJSONL:
+    """
+    Random access to the records of an uncompressed JSONL file.
+
+    The file is memory-mapped and indexed by line offsets, so records can be read by index
+    or sampled without parsing (or even reading) the whole file.
+    """
+
+    def __init__(self, path: str | pathlib.Path, *, record_type: type | None = None) -> None:
+        self.path = pathlib.Path(path)
+        self._loads = _get_loads(record_type)
+        with self.path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = self._build_index()
+
+    def _build_index(self) -> array.array:
+        offsets = array.array("q", [0])
+        mm = self._mm
+        find = mm.find
+        position = find(b"\n")
+        while position != -1:
+            offsets.append(position + 1)
+            position = find(b"\n", position + 1)
+        if offsets[-1] == len(mm):  # no partial line at the end
+            offsets.pop()
+        offsets.append(len(mm))
+        return offsets
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+
+    def __enter__(self) -> MappedJSONL:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def get_line(self, index: int) -> bytes:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        return self._mm[self._offsets[index] : self._offsets[index + 1]]
+
+    def __getitem__(self, index: int) -> Any:
+        return self._loads(self.get_line(index))
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def sample(self, k: int, *, seed: int | None = None) -> list[Any]:
+        indices = sorted(random.Random(seed).sample(range(len(self)), min(k, len(self))))
+        return [self[index] for index in indices]
@@ -0,0 +1,240 @@
+"""Rate limiting shared by everything that talks to GitHub.
+
+Each GitHub API resource (core, search, code search, GraphQL, and raw.githubusercontent.com)
+gets a token bucket. The refill rate adapts to the `x-ratelimit-remaining`/`x-ratelimit-reset`
+headers of responses, so the remaining budget is spread over the rest of the window instead
+of being burned through and then waited out; a burst of requests is still allowed to go out
+unpaced. Rate-limited responses (`retry-after`, or no remaining budget) block the bucket
+until the limit resets.
+
+The limiter hooks into httpx clients via event hooks; see `sync_event_hooks` and `async_event_hooks`.
+Requests sent with `send_sync`/`send_async` are also retried when rate limited, once the limiter
+lets them through again.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections.abc import Awaitable, Callable
+
+import httpx
+
+from ruff_usage_aggregate.helpers.zzz import sleep_with_progress
+
+log = logging.getLogger(__name__)
+
+# Default (limit, window in seconds) per resource, used until response headers tell us better.
+# The raw content host and the web pages have no documented limits, so they're only throttled when told to back off.
+DEFAULT_LIMITS: dict[str, tuple[int, int] | None] = {
+    "core": (5000, 3600),
+    "search": (30, 60),
+    "code_search": (10, 60),
+    "graphql": (5000, 3600),
+    "raw": None,
+    "web": None,
+}
+
+# The maximum number of requests that may go out back-to-back without pacing.
+MAX_BURST = 50
+
+# Waits longer than this many seconds get a progress bar (in sync code) or a log message.
+LONG_WAIT = 5
+
+# Rate-limited requests are retried this many times before the rate-limited response is returned,
+# backing off for at least DEFAULT_BACK_OFF * 2**attempt seconds in between.
+MAX_RATE_LIMIT_RETRIES = 5
+DEFAULT_BACK_OFF = 10.0
+
+
+def get_resource_for_url(url: httpx.URL) -> str:
+    if url.host == "raw.githubusercontent.com":
+        return "raw"
+    if url.host == "github.com":
+        return "web"
+    if url.path.startswith("/search/code"):
+        return "code_search"
+    if url.path.startswith("/search/"):
+        return "search"
+    if url.path.startswith("/graphql"):
+        return "graphql"
+    return "core"
+
+
+def is_rate_limited(response: httpx.Response) -> bool:
+    if response.status_code == 429:
+        return True
+    # Other 403s (e.g. for private resources) won't go away by retrying.
+    return response.status_code == 403 and (
+        "retry-after" in response.headers or response.headers.get("x-ratelimit-remaining") == "0"
+    )
+
+
+class TokenBucket:
+    def __init__(self, name: str, limit: tuple[int, int] | None) -> None:
+        self.name = name
+        if limit:
+            n, window = limit
+            self.rate: float | None = n / window
+            self.capacity = float(min(n, MAX_BURST))
+        else:
+            self.rate = None
+            self.capacity = float(MAX_BURST)
+        self.default_rate = self.rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """
+        Take a token; return the number of seconds to wait before using it.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if not self.rate:
+            return wait
+        self.tokens -= 1
+        if self.tokens < 0:
+            # Tokens going negative queues up concurrent callers behind each other.
+            wait = max(wait, -self.tokens / self.rate)
+        return wait
+
+    def block(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+        if not self.rate:
+            self.rate = self.default_rate
+
+    def update(self, remaining: int, reset_in: float) -> None:
+        """
+        Adapt to the budget reported by the server: `remaining` requests for the next `reset_in` seconds.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        reset_in = max(reset_in, 1.0)
+        if remaining <= 0:
+            log.info(f"Rate limit for {self.name} exhausted, blocking for {reset_in:.0f}s")
+            self.block(reset_in + 1)
+            return
+        self.tokens = min(self.tokens, remaining)
+        self.rate = max(remaining - max(self.tokens, 0), 1) / reset_in
+
+
+class RateLimiter:
+    def __init__(self) -> None:
+        self.buckets = {name: TokenBucket(name, limit) for name, limit in DEFAULT_LIMITS.items()}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, url: httpx.URL) -> TokenBucket:
+        return self.buckets[get_resource_for_url(url)]
+
+    def reserve(self, url: httpx.URL) -> float:
+        with self.lock:
+            return self.get_bucket(url).reserve()
+
+    def back_off(self, url: httpx.URL, seconds: float) -> None:
+        with self.lock:
+            self.get_bucket(url).block(seconds)
+
+    def wait_sync(self, url: httpx.URL) -> None:
+        wait = self.reserve(url)
+        if wait > LONG_WAIT:
+            sleep_with_progress(math.ceil(wait), f"Rate limited ({get_resource_for_url(url)})")
+        elif wait > 0:
+            time.sleep(wait)
+
+    async def wait_async(self, url: httpx.URL) -> None:
+        wait = self.reserve(url)
+        if wait > LONG_WAIT:
+            log.info(f"Rate limited ({get_resource_for_url(url)}), waiting {wait:.0f}s")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_response(self, response: httpx.Response) -> None:
+        headers = response.headers
+        with self.lock:
+            bucket = self.get_bucket(response.request.url)
+            if response.status_code in (403, 429) and "retry-after" in headers:
+                bucket.block(float(headers["retry-after"]))
+            elif "x-ratelimit-remaining" in headers and "x-ratelimit-reset" in headers:
+                reset_in = int(headers["x-ratelimit-reset"]) - time.time()
+                bucket.update(int(headers["x-ratelimit-remaining"]), reset_in)
+            elif response.status_code == 429:
+                # Secondary rate limits without further information: wait at least a minute.
+                bucket.block(60)
+
+    def _back_off_after(self, response: httpx.Response, attempt: int, back_off: float) -> None:
+        # `on_response` will have blocked the bucket until the limit resets if it knows when that is;
+        # otherwise, back off for a while anyway, longer each time.
+        seconds = back_off * 2**attempt
+        log.warning(f"Rate limited ({response.status_code}) for {response.request.url}, backing off {seconds:.0f}s")
+        self.back_off(response.request.url, seconds)
+
+    def send_sync(
+        self,
+        send: Callable[[], httpx.Response],
+        *,
+        max_retries: int = MAX_RATE_LIMIT_RETRIES,
+        back_off: float = DEFAULT_BACK_OFF,
+    ) -> httpx.Response:
+        """
+        Call `send` (e.g. `lambda: client.get(url)`, on a client with this limiter's event hooks),
+        retrying while the response is rate limited.
+
+        The last response is returned even if it's still rate limited; see `is_rate_limited`.
+        """
+        for attempt in range(max_retries):
+            response = send()
+            if not is_rate_limited(response):
+                return response
+            response.close()
+            self._back_off_after(response, attempt, back_off)
+        return send()
+
+    async def send_async(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        *,
+        max_retries: int = MAX_RATE_LIMIT_RETRIES,
+        back_off: float = DEFAULT_BACK_OFF,
+    ) -> httpx.Response:
+        """
+        Like `send_sync`, for an async client.
+        """
+        for attempt in range(max_retries):
+            response = await send()
+            if not is_rate_limited(response):
+                return response
+            await response.aclose()
+            self._back_off_after(response, attempt, back_off)
+        return await send()
+
+    def sync_event_hooks(self) -> dict[str, list]:
+        return {
+            "request": [lambda request: self.wait_sync(request.url)],
+            "response": [self.on_response],
+        }
+
+    def async_event_hooks(self) -> dict[str, list]:
+        async def request_hook(request: httpx.Request) -> None:
+            await self.wait_async(request.url)
+
+        async def response_hook(response: httpx.Response) -> None:
+            self.on_response(response)
+
+        return {"request": [request_hook], "response": [response_hook]}
+
+
+# The process-wide limiter shared by all GitHub clients.
+GITHUB_RATE_LIMITER = RateLimiter()
@@ -0,0 +1,203 @@
+"""Persistent parse cache for `scan-tomls`.
+
+Maps a file's name, mtime and size to the hash of its contents, and a content hash
+(plus the kind of file, since a `ruff.toml` and a `pyproject.toml` with the same
+contents are parsed differently) to the resulting `RuffConfig`, so rescans only
+need to parse new or changed files.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ruff_usage_aggregate.models import RuffConfig
+
+if TYPE_CHECKING:
+    from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+
+log = logging.getLogger(__name__)
+
+# Bump this whenever `RuffConfig.from_toml_section` changes, so old results get thrown away.
+CACHE_VERSION = 1
+
+# Sentinel stored for files that were parsed fine but didn't contain a Ruff config.
+NOT_RUFFY = "null"
+
+
+def get_default_cache_path(input_directory: pathlib.Path) -> pathlib.Path:
+    input_directory = input_directory.resolve()
+    return input_directory.with_name(f"{input_directory.name}.scan-cache.sqlite")
+
+
+def get_toml_kind(name: str) -> str:
+    return "ruff" if name.endswith("ruff.toml") else "pyproject"
+
+
+@dataclass
+class ScanCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return (self.hits / total) if total else 0.0
+
+    def __str__(self) -> str:
+        return f"Scan cache: {self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate)"
+
+
+class ScanCache:
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.stats = ScanCacheStats()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        if version != CACHE_VERSION:
+            if version:
+                log.info(f"Scan cache version {version} != {CACHE_VERSION}, discarding it")
+            self.db.executescript(
+                f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS configs;
+                PRAGMA user_version = {CACHE_VERSION};
+                """,
+            )
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                text_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS configs (
+                text_hash TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                config TEXT NOT NULL,
+                PRIMARY KEY (text_hash, kind)
+            );
+            """,
+        )
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self) -> ScanCache:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def get_text_hash(self, name: str, stat: os.stat_result) -> str | None:
+        row = self.db.execute(
+            "SELECT text_hash FROM files WHERE name = ? AND mtime_ns = ? AND size = ?",
+            (name, stat.st_mtime_ns, stat.st_size),
+        ).fetchone()
+        return row[0] if row else None
+
+    def has_config(self, name: str, text_hash: str) -> bool:
+        return bool(
+            self.db.execute(
+                "SELECT 1 FROM configs WHERE text_hash = ? AND kind = ?",
+                (text_hash, get_toml_kind(name)),
+            ).fetchone(),
+        )
+
+    def get_config(self, name: str, text_hash: str) -> tuple[bool, RuffConfig | None]:
+        """
+        Look up a parsed config by content hash.
+
+        Returns a tuple of (found, config); the config may be None for a file known not to be ruffy.
+        """
+        row = self.db.execute(
+            "SELECT config FROM configs WHERE text_hash = ? AND kind = ?",
+            (text_hash, get_toml_kind(name)),
+        ).fetchone()
+        if not row:
+            return (False, None)
+        if row[0] == NOT_RUFFY:
+            return (True, None)
+        config = RuffConfig.from_dict(json.loads(row[0]))
+        config.name = name
+        return (True, config)
+
+    def put(self, name: str, stat: os.stat_result, text_hash: str, config: RuffConfig | None) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (name, mtime_ns, size, text_hash) VALUES (?, ?, ?, ?)",
+            (name, stat.st_mtime_ns, stat.st_size, text_hash),
+        )
+        self.put_config(name, text_hash, config)
+
+    def put_config(self, name: str, text_hash: str, config: RuffConfig | None) -> None:
+        """
+        Cache a parsed config by content hash only (for files that aren't on disk, e.g. in a corpus store).
+        """
+        if config is not None:
+            config_dict = config.to_dict()
+            config_dict.pop("name")  # the same contents may be found under different names
+            serialized = json.dumps(config_dict, sort_keys=True)
+        else:
+            serialized = NOT_RUFFY
+        self.db.execute(
+            "INSERT OR REPLACE INTO configs (text_hash, kind, config) VALUES (?, ?, ?)",
+            (text_hash, get_toml_kind(name), serialized),
+        )
+
+    def invalidate(
+        self,
+        input_directory: pathlib.Path | None = None,
+        *,
+        store: CorpusStore | None = None,
+    ) -> tuple[int, int]:
+        """
+        Evict cache entries.
+
+        If `input_directory` is given, only entries for files that have been removed or changed
+        (and the configs no longer referred to by any file) are evicted. If `store` is given,
+        only the configs for contents no longer in the corpus store are evicted. Otherwise everything is.
+
+        Returns the number of evicted file and config entries.
+        """
+        if input_directory is None and store is None:
+            n_files = self.db.execute("DELETE FROM files").rowcount
+        elif input_directory is not None:
+            stale = []
+            for name, mtime_ns, size in self.db.execute("SELECT name, mtime_ns, size FROM files"):
+                try:
+                    stat = (input_directory / name).stat()
+                except FileNotFoundError:
+                    stale.append((name,))
+                    continue
+                if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size):
+                    stale.append((name,))
+            self.db.executemany("DELETE FROM files WHERE name = ?", stale)
+            n_files = len(stale)
+        else:
+            n_files = 0
+        # Configs for a corpus store aren't referred to by any file entry (see `put_config`),
+        # so the store's content hashes count as references too.
+        self.db.execute("CREATE TEMP TABLE live_hashes (text_hash TEXT PRIMARY KEY)")
+        if store is not None:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO live_hashes (text_hash) VALUES (?)",
+                ((text_hash,) for _, _, text_hash in store.iter_index()),
+            )
+        n_configs = self.db.execute(
+            "DELETE FROM configs WHERE text_hash NOT IN (SELECT text_hash FROM files) "
+            "AND text_hash NOT IN (SELECT text_hash FROM live_hashes)",
+        ).rowcount
+        self.db.execute("DROP TABLE live_hashes")
+        self.db.commit()
+        self.db.execute("VACUUM")
+        return (n_files, n_configs)
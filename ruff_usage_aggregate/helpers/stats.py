@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import statistics
+from collections import Counter
+
+
+def counter_median(counter: Counter) -> float:
+    """
+    Compute the median of the values in a value -> count counter, as `statistics.median` would for the flat data.
+    """
+    items = sorted((value, count) for value, count in counter.items() if count > 0)
+    n = sum(count for _, count in items)
+    if n == 0:
+        raise statistics.StatisticsError("no median for empty data")
+    lo = hi = None
+    seen = 0
+    for value, count in items:
+        seen += count
+        if lo is None and seen > (n - 1) // 2:
+            lo = value
+        if seen > n // 2:
+            hi = value
+            break
+    if n % 2 == 1:
+        return hi
+    return (lo + hi) / 2
+
+
+def counter_mean(counter: Counter) -> float:
+    n = counter.total()
+    if n <= 0:
+        raise statistics.StatisticsError("mean requires at least one data point")
+    return sum(value * count for value, count in counter.items()) / n
+
+
+def counter_mode(counter: Counter):
+    """
+    Return the most common value in the counter (the smallest one, in case of ties).
+    """
+    if not counter:
+        raise statistics.StatisticsError("no mode for empty data")
+    return min(counter.items(), key=lambda item: (-item[1], item[0]))[0]
+
+
+def counter_quantile(counter: Counter, q: float) -> float:
+    """
+    Compute the q-quantile (0 <= q <= 1) of the values in a value -> count counter,
+    interpolating linearly between data points like `numpy.quantile` does by default.
+    """
+    items = sorted((value, count) for value, count in counter.items() if count > 0)
+    n = sum(count for _, count in items)
+    if n == 0:
+        raise statistics.StatisticsError("no quantiles for empty data")
+    position = q * (n - 1)
+    lo_index = int(position)
+    fraction = position - lo_index
+    lo = hi = None
+    seen = 0
+    for value, count in items:
+        seen += count
+        if lo is None and seen > lo_index:
+            lo = value
+        if seen > lo_index + 1 or seen == n:
+            hi = value
+            break
+    return lo + (hi - lo) * fraction
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+
+class Vocabulary:
+    """
+    Interns strings (rule codes, field names) to small integers, e.g. to use as column indices.
+    """
+
+    __slots__ = ("_indices", "_values")
+
+    def __init__(self) -> None:
+        self._indices: dict[str, int] = {}
+        self._values: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def index(self, value: str) -> int:
+        try:
+            return self._indices[value]
+        except KeyError:
+            index = self._indices[value] = len(self._values)
+            self._values.append(value)
+            return index
+
+    def value(self, index: int) -> str:
+        return self._values[index]
@@ -2,117 +2,246 @@ from __future__ import annotations
 
 import dataclasses
 import logging
-import statistics
-from collections import Counter, defaultdict
+from collections import Counter
 from collections.abc import Iterable
 from functools import cached_property
 from typing import Any
 
 from ruff_usage_aggregate.constants import UNSET
 from ruff_usage_aggregate.errors import NotRuffyError
+from ruff_usage_aggregate.helpers.stats import counter_median
 
 log = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass(frozen=True)
-class ScanResult:
-    configs_by_hash: dict[str, list[RuffConfig]] = dataclasses.field(default_factory=dict)
+# Fields whose items are counted one by one in `ScanResult.aggregated_data`.
+AGGREGATED_SET_FIELDS = ("extend_ignore", "extend_select", "fixable", "ignore", "select", "unfixable")
 
-    @property
-    def all_configs(self) -> Iterable[RuffConfig]:
-        for config_list in self.configs_by_hash.values():
-            yield from config_list
+AGGREGATED_DATA_KEYS = (
+    "extend_ignore",
+    "extend_select",
+    "fixable",
+    "ignore",
+    "line_length",
+    "per_file_ignores",
+    "select",
+    "target_version",
+    "unfixable",
+    "fields_set",
+)
 
-    @property
-    def unique_configs(self) -> Iterable[RuffConfig]:
-        for config_list in self.configs_by_hash.values():
-            yield config_list[0]
+# Fields whose whole sets of values are counted in `ScanResult.value_set_counters`.
+VALUE_SET_FIELDS = ("extend_ignore", "extend_select", "fields_set", "fixable", "ignore", "select", "unfixable")
 
-    @property
-    def n_unique(self) -> int:
-        return len(self.configs_by_hash)
 
-    @cached_property
-    def n_total(self) -> int:
-        return sum(len(config_list) for config_list in self.configs_by_hash.values())
+@dataclasses.dataclass(frozen=True)
+class ScanResult:
+    n_total: int = 0
+    n_unique: int = 0
+    aggregated_data: dict[str, Counter] = dataclasses.field(default_factory=dict)
+    value_set_counters: dict[str, Counter] = dataclasses.field(default_factory=dict)
+    line_lengths: Counter = dataclasses.field(default_factory=Counter)
 
-    @cached_property
+    @property
     def n_deduplicated(self) -> int:
-        return sum(len(config_list) - 1 for config_list in self.configs_by_hash.values())
+        return self.n_total - self.n_unique
+
+    @classmethod
+    def from_counters(
+        cls,
+        *,
+        n_total: int,
+        n_unique: int,
+        aggregated_data: dict[str, Counter],
+        value_set_counters: dict[str, Counter],
+        line_lengths: Counter,
+    ) -> ScanResult:
+        """
+        Build a result from raw counters (whose value sets must be frozensets), putting them in canonical order.
+        """
+        return cls(
+            n_total=n_total,
+            n_unique=n_unique,
+            aggregated_data={key: _canonicalize_counter(c) for key, c in aggregated_data.items()},
+            value_set_counters={key: _canonicalize_counter(c) for key, c in value_set_counters.items()},
+            line_lengths=_canonicalize_counter(line_lengths),
+        )
 
     @classmethod
     def from_config_list(cls, config_list: Iterable[RuffConfig]) -> ScanResult:
-        configs_by_hash = defaultdict(list)
+        aggregator = Aggregator()
         for config in config_list:
-            configs_by_hash[config.text_hash].append(config)
-        return cls(configs_by_hash=configs_by_hash)
-
-    @cached_property
-    def aggregated_data(self) -> dict:
-        aggregated = {
-            "extend_ignore": Counter(),
-            "extend_select": Counter(),
-            "fixable": Counter(),
-            "ignore": Counter(),
-            "line_length": Counter(),
-            "per_file_ignores": Counter(),
-            "select": Counter(),
-            "target_version": Counter(),
-            "unfixable": Counter(),
-            "fields_set": Counter(),
-        }
-        for config in self.unique_configs:
-            aggregated["extend_ignore"].update(config.extend_ignore or [UNSET])
-            aggregated["extend_select"].update(config.extend_select or [UNSET])
-            aggregated["fixable"].update(config.fixable or [UNSET])
-            aggregated["ignore"].update(config.ignore or [UNSET])
-            aggregated["line_length"][config.line_length or UNSET] += 1
-            aggregated["target_version"][config.target_version or UNSET] += 1
-            aggregated["select"].update(config.select or [UNSET])
-            aggregated["unfixable"].update(config.unfixable or [UNSET])
-            if config.per_file_ignores is not None:
-                for ignores in config.per_file_ignores.values():
-                    aggregated["per_file_ignores"].update(ignores)
-            aggregated["fields_set"].update(config.fields_set)
-        return aggregated
+            aggregator.add(config)
+        return aggregator.result()
 
     @cached_property
     def most_common_set_values(self) -> dict[str, Any]:
         values = {}
         for field, counter in self.aggregated_data.items():
             for item, _count in counter.most_common():
-                if item is not UNSET:
+                if item != UNSET:
                     values[field] = item
                     break
         return values
 
     @cached_property
     def median_line_length(self) -> int:
-        return statistics.median(c.line_length for c in self.unique_configs if c.line_length is not None)
+        return counter_median(self.line_lengths)
 
-    @cached_property
-    def value_set_counters(self) -> dict:
-        keys = {
-            "extend_ignore",
-            "extend_select",
-            "fields_set",
-            "fixable",
-            "ignore",
-            "select",
-            "unfixable",
+
+def _counter_sort_key(value) -> tuple:
+    if isinstance(value, frozenset):
+        return (2, sorted(value))
+    if isinstance(value, str):
+        return (1, value)
+    return (0, value)
+
+
+def _canonicalize_counter(counter: Counter) -> Counter:
+    """
+    Return a copy of the counter with only positive counts, in a canonical key order.
+
+    This makes the output (e.g. ties in `most_common`) independent of the order configs were seen in,
+    so aggregates computed over shards and merged are identical to one computed in one go.
+    """
+    items = [(key, count) for key, count in counter.items() if count > 0]
+    return Counter(dict(sorted(items, key=lambda item: _counter_sort_key(item[0]))))
+
+
+def _counter_to_jsonable(counter: Counter) -> list:
+    return [[sorted(key) if isinstance(key, frozenset) else key, count] for key, count in counter.items()]
+
+
+def _counter_from_jsonable(pairs: list) -> Counter:
+    return Counter({(frozenset(key) if isinstance(key, list) else key): count for key, count in pairs})
+
+
+@dataclasses.dataclass
+class Aggregator:
+    """
+    Accumulates the aggregates of a `ScanResult` from a stream of configs in a single pass.
+
+    Configs with the same text hash are only counted once.
+
+    If `configs` is not None, the unique configs are also kept, so the aggregator can be merged
+    with another one (see `merge`) that may have seen some of the same configs.
+    """
+
+    n_total: int = 0
+    hash_counts: Counter = dataclasses.field(default_factory=Counter)
+    aggregated_data: dict[str, Counter] = dataclasses.field(
+        default_factory=lambda: {key: Counter() for key in AGGREGATED_DATA_KEYS},
+    )
+    value_set_counters: dict[str, Counter] = dataclasses.field(
+        default_factory=lambda: {key: Counter() for key in VALUE_SET_FIELDS},
+    )
+    line_lengths: Counter = dataclasses.field(default_factory=Counter)
+    configs: dict[str | None, RuffConfig] | None = None
+
+    @classmethod
+    def mergeable(cls) -> Aggregator:
+        return cls(configs={})
+
+    def add(self, config: RuffConfig, count: int = 1) -> None:
+        """
+        Add a config, found in `count` files with identical contents.
+        """
+        self.n_total += count
+        self.hash_counts[config.text_hash] += count
+        if self.hash_counts[config.text_hash] > count:
+            return
+        if self.configs is not None:
+            self.configs[config.text_hash] = config
+        self._count(config, 1)
+
+    def _count(self, config: RuffConfig, sign: int) -> None:
+        agg = self.aggregated_data
+        vsc = self.value_set_counters
+        update = Counter.update if sign > 0 else Counter.subtract
+        for key, values in (
+            ("extend_ignore", config.extend_ignore),
+            ("extend_select", config.extend_select),
+            ("fixable", config.fixable),
+            ("ignore", config.ignore),
+            ("select", config.select),
+            ("unfixable", config.unfixable),
+        ):
+            update(agg[key], values or [UNSET])
+            vsc[key][frozenset(values) if values is not None else UNSET] += sign
+        agg["line_length"][config.line_length or UNSET] += sign
+        agg["target_version"][config.target_version or UNSET] += sign
+        if config.per_file_ignores is not None:
+            for ignores in config.per_file_ignores.values():
+                update(agg["per_file_ignores"], ignores)
+        update(agg["fields_set"], config.fields_set)
+        vsc["fields_set"][frozenset(config.fields_set)] += sign
+        if config.line_length is not None:
+            self.line_lengths[config.line_length] += sign
+
+    def merge(self, other: Aggregator) -> None:
+        """
+        Merge another aggregator's data into this one, counting configs seen by both only once.
+        """
+        overlap = [text_hash for text_hash in other.hash_counts if text_hash in self.hash_counts]
+        if overlap and other.configs is None:
+            raise ValueError("Can't merge overlapping aggregates without their configs")
+        self.n_total += other.n_total
+        self.hash_counts.update(other.hash_counts)
+        for key, counter in other.aggregated_data.items():
+            self.aggregated_data[key].update(counter)
+        for key, counter in other.value_set_counters.items():
+            self.value_set_counters[key].update(counter)
+        self.line_lengths.update(other.line_lengths)
+        for text_hash in overlap:
+            self._count(other.configs[text_hash], -1)
+        if self.configs is not None:
+            if other.configs is None:
+                raise ValueError("Can't merge an aggregate without configs into one with configs")
+            for text_hash, config in other.configs.items():
+                self.configs.setdefault(text_hash, config)
+
+    def result(self) -> ScanResult:
+        return ScanResult.from_counters(
+            n_total=self.n_total,
+            n_unique=len(self.hash_counts),
+            aggregated_data=self.aggregated_data,
+            value_set_counters=self.value_set_counters,
+            line_lengths=self.line_lengths,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Convert to a JSON-serializable dict.
+        """
+        return {
+            "n_total": self.n_total,
+            "hash_counts": _counter_to_jsonable(self.hash_counts),
+            "aggregated_data": {key: _counter_to_jsonable(c) for key, c in self.aggregated_data.items()},
+            "value_set_counters": {key: _counter_to_jsonable(c) for key, c in self.value_set_counters.items()},
+            "line_lengths": _counter_to_jsonable(self.line_lengths),
+            "configs": ([config.to_dict() for config in self.configs.values()] if self.configs is not None else None),
         }
-        value_sets = {key: Counter() for key in keys}
-        for config in self.unique_configs:
-            for key in keys:
-                v_set = getattr(config, key)
-                if v_set is not None:
-                    value_sets[key][frozenset(v_set)] += 1
-                else:
-                    value_sets[key][UNSET] += 1
-        return value_sets
-
-
-@dataclasses.dataclass()
+
+    @classmethod
+    def from_dict(cls, d: dict[str, Any]) -> Aggregator:
+        """
+        Inverse of `to_dict`.
+        """
+        return cls(
+            n_total=d["n_total"],
+            hash_counts=_counter_from_jsonable(d["hash_counts"]),
+            aggregated_data={key: _counter_from_jsonable(c) for key, c in d["aggregated_data"].items()},
+            value_set_counters={key: _counter_from_jsonable(c) for key, c in d["value_set_counters"].items()},
+            line_lengths=_counter_from_jsonable(d["line_lengths"]),
+            configs=(
+                {config["text_hash"]: RuffConfig.from_dict(config) for config in d["configs"]}
+                if d["configs"] is not None
+                else None
+            ),
+        )
+
+
+@dataclasses.dataclass(slots=True)
 class RuffConfig:
     """
     Ruff config scavenged from a file
@@ -185,3 +314,31 @@ class RuffConfig:
             log.debug("Unrc.fields_set: %r", ruff_section)
 
         return rc
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Convert to a JSON-serializable dict (sets become sorted lists).
+        """
+        d = {}
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if isinstance(value, set):
+                value = sorted(value)
+            elif isinstance(value, dict):
+                value = {k: sorted(v) for k, v in value.items()}
+            d[field.name] = value
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict[str, Any]) -> RuffConfig:
+        """
+        Inverse of `to_dict`.
+        """
+        kwargs = {}
+        for key, value in d.items():
+            if isinstance(value, list):
+                value = set(value)
+            elif isinstance(value, dict):
+                value = {k: set(v) for k, v in value.items()}
+            kwargs[key] = value
+        return cls(**kwargs)
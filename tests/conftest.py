@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+import pytest
+
+from ruff_usage_aggregate.models import RuffConfig
+
+CONFIG_SECTIONS = [
+    {"select": ["E", "F"], "ignore": ["E501"], "line-length": 100, "target-version": "py38"},
+    {"select": ["E", "F", "I"], "target-version": "py38"},
+    {"select": ["E", "F"], "ignore": ["E501"], "line-length": 100, "target-version": "py38"},
+    {"extend-select": ["B"], "extend-ignore": ["B008"], "unfixable": ["F401"], "line-length": 88},
+    {"line-length": 120, "per-file-ignores": {"__init__.py": ["F401"]}},
+    {"select": ["ALL"], "fixable": ["I"], "target-version": "py311"},
+    # Edge cases: empty values, and the same keys in different sections.
+    {"select": [], "ignore": [], "line-length": 0},
+    {"select": ["E", "F"], "extend-ignore": ["B008"], "target-version": "py311"},
+    {"ignore": [], "fixable": ["I"], "unfixable": ["F401", "F841"]},
+    {"line-length": 88, "per-file-ignores": {"__init__.py": ["F401"], "tests/*": ["S101", "F401"]}},
+    {"per-file-ignores": {}, "extend-select": ["B", "UP"]},
+    {"select": [], "target-version": "py38", "line-length": 100},
+]
+
+
+@pytest.fixture
+def ruff_configs() -> list[RuffConfig]:
+    return [
+        RuffConfig.from_toml_section(
+            name=f"{i}.toml",
+            text_hash=hashlib.sha256(json.dumps(section, sort_keys=True).encode()).hexdigest(),
+            ruff_section=section,
+        )
+        for i, section in enumerate(CONFIG_SECTIONS)
+    ]
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from ruff_usage_aggregate.actions import clean_with_repo_api
+from ruff_usage_aggregate.actions.clean_with_repo_api import (
+    RepoInfo,
+    RepoStatus,
+    query_github_graphql,
+    query_github_with_retries,
+)
+
+REPOS = [
+    ("akx", "ruff-usage-aggregate", "pyproject.toml"),
+    ("someone", "fork-of-ruff", "pyproject.toml"),
+    ("nobody", "gone", "ruff.toml"),
+]
+
+NODES = {
+    ("akx", "ruff-usage-aggregate"): {"isFork": False, "defaultBranchRef": {"name": "master"}},
+    ("someone", "fork-of-ruff"): {"isFork": True, "defaultBranchRef": {"name": "main"}},
+}
+
+
+def get_graphql_response(request: httpx.Request) -> httpx.Response:
+    """
+    Answer a batched repository query like the GitHub GraphQL API would.
+    """
+    variables = json.loads(request.content)["variables"]
+    data = {}
+    errors = []
+    for i in range(len(variables) // 2):
+        key = (variables[f"owner{i}"], variables[f"name{i}"])
+        data[f"r{i}"] = NODES.get(key)
+        if key not in NODES:
+            errors.append({"type": "NOT_FOUND", "path": [f"r{i}"], "message": f"Could not resolve {key}"})
+    return httpx.Response(200, json={"data": data, "errors": errors})
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(clean_with_repo_api, "RETRY_BACKOFF", 0)
+
+
+def run_query(handler, repos=REPOS):
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await query_github_with_retries(repos, client, "token", graphql=True)
+
+    return asyncio.run(_run())
+
+
+def test_graphql_batches_aliases():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return get_graphql_response(request)
+
+    results = run_query(handler)
+    assert len(requests) == 1
+    query = json.loads(requests[0].content)["query"]
+    assert all(f"r{i}: repository(owner: $owner{i}, name: $name{i})" in query for i in range(len(REPOS)))
+    assert results[:2] == [
+        RepoInfo("akx", "ruff-usage-aggregate", "pyproject.toml", "master", RepoStatus.REPO),
+        RepoInfo("someone", "fork-of-ruff", "pyproject.toml", "main", RepoStatus.FORK),
+    ]
+
+
+def test_graphql_not_found_is_error_entry():
+    results = run_query(get_graphql_response)
+    assert results[2] == RepoInfo("nobody", "gone", "ruff.toml", None, RepoStatus.ERROR)
+
+
+@pytest.mark.parametrize(
+    "transient_response",
+    [
+        httpx.Response(502),
+        httpx.Response(200, json={"data": None, "errors": [{"type": "RATE_LIMITED", "message": "slow down"}]}),
+    ],
+)
+def test_graphql_retries_transient_errors(transient_response: httpx.Response):
+    n_requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal n_requests
+        n_requests += 1
+        if n_requests == 1:
+            return transient_response
+        return get_graphql_response(request)
+
+    results = run_query(handler)
+    assert n_requests == 2
+    assert all(isinstance(result, RepoInfo) for result in results)
+
+
+def test_graphql_gives_up_on_client_errors():
+    n_requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal n_requests
+        n_requests += 1
+        return httpx.Response(401)
+
+    results = run_query(handler)
+    assert n_requests == 1
+    assert [(owner, repo) for owner, repo, _ in results] == [(owner, repo) for owner, repo, _ in REPOS]
+    assert all(isinstance(error, httpx.HTTPStatusError) for _, _, error in results)
+
+
+def test_query_github_graphql_raises_without_data():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"data": None, "errors": [{"type": "RATE_LIMITED"}]})
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await query_github_graphql(REPOS, client, "token")
+
+    with pytest.raises(clean_with_repo_api.GraphQLQueryError):
+        asyncio.run(_run())
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+import pytest
+
+from ruff_usage_aggregate.models import Aggregator, RuffConfig
+
+pytest.importorskip("numpy")
+
+from ruff_usage_aggregate.columnar import ColumnarAggregator  # noqa: E402
+
+
+def test_columnar_matches_aggregator(ruff_configs: list[RuffConfig]):
+    aggregator = Aggregator()
+    columnar = ColumnarAggregator()
+    for i, config in enumerate(ruff_configs):
+        # Configs already seen are only counted towards the total.
+        for _ in range(i + 1):
+            aggregator.add(config)
+            columnar.add(config)
+    assert columnar.result() == aggregator.result()
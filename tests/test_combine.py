@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from ruff_usage_aggregate.actions.combine import combine_records, combine_records_external
+
+
+def get_records(n: int = 200, seed: int = 42) -> list[dict]:
+    """
+    Get records with plenty of duplicate keys, some of them with conflicting or missing refs.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        record = {
+            "owner": rng.choice(["akx", "astral-sh", "someone"]),
+            "repo": f"repo{rng.randrange(10)}",
+            "path": rng.choice(["pyproject.toml", "ruff.toml"]),
+            "ref": rng.choice([None, "", "main", "master", f"v{i}"]),
+        }
+        if rng.random() < 0.2:
+            record["stars"] = i
+        records.append(record)
+    return records
+
+
+def test_combine_records_later_wins():
+    records = [
+        {"owner": "b", "repo": "b", "path": "pyproject.toml", "ref": "main"},
+        {"owner": "a", "repo": "a", "path": "pyproject.toml", "ref": "main"},
+        {"owner": "b", "repo": "b", "path": "pyproject.toml", "ref": ""},
+        {"owner": "a", "repo": "a", "path": "pyproject.toml", "ref": "master"},
+    ]
+    assert combine_records(records) == [
+        {"owner": "a", "repo": "a", "path": "pyproject.toml", "ref": "master"},
+        {"owner": "b", "repo": "b", "path": "pyproject.toml", "ref": "main"},
+    ]
+
+
+@pytest.mark.parametrize(("run_size", "max_fan_in"), [(2, 2), (7, 3), (1000, 128)])
+def test_combine_records_external_matches_in_memory(run_size: int, max_fan_in: int):
+    records = get_records()
+    expected = combine_records(records)
+    assert len(expected) < len(records)
+    assert list(combine_records_external(records, run_size=run_size, max_fan_in=max_fan_in)) == expected
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+
+from ruff_usage_aggregate.actions.github_search import _fetch_search_page
+
+
+def fetch_with_responses(responses: list[httpx.Response]) -> tuple[dict, int]:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        return _fetch_search_page(client, "token", "ruff in:file size:1..1", 1), len(requests)
+
+
+def test_rate_limited_search_is_retried():
+    data, n_requests = fetch_with_responses(
+        [
+            httpx.Response(403, headers={"x-ratelimit-remaining": "0"}),
+            httpx.Response(429),
+            httpx.Response(200, json={"total_count": 0, "items": []}),
+        ],
+    )
+    assert data == {"total_count": 0, "items": []}
+    assert n_requests == 3
+
+
+@pytest.mark.parametrize("status_code", [403, 422])
+def test_rejected_search_raises(status_code: int):
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch_with_responses([httpx.Response(status_code, json={"message": "Validation Failed"})])
@@ -0,0 +1,59 @@
+"""
+Check that CLI commands don't import modules they don't need (the usual way startup time regresses).
+
+The commands are run in a subprocess with `python -X importtime`, so the modules imported by
+the test run itself don't count.
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Heavy modules (or ones only some commands need) that should stay out of these commands' startup.
+NETWORK_MODULES = {"asyncio", "envparse", "httpx", "tqdm"}
+COMMANDS = {
+    "--help": (["--help"], NETWORK_MODULES | {"multiprocessing", "sqlite3", "ruff_usage_aggregate.actions"}),
+    "combine": (["combine", "{empty_jsonl}"], NETWORK_MODULES | {"multiprocessing"}),
+    "scan-tomls": (["scan-tomls", "-i", "{tomls_dir}", "-o", "json"], NETWORK_MODULES | {"multiprocessing"}),
+}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def get_imported_modules(args: list[str], cwd: pathlib.Path) -> set[str]:
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "ruff_usage_aggregate", *args],
+        cwd=cwd,  # away from any .env file
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {m.group(4) for line in proc.stderr.splitlines() if (m := IMPORTTIME_RE.match(line))}
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_command_imports(tmp_path: pathlib.Path, command: str):
+    empty_jsonl = tmp_path / "empty.jsonl"
+    empty_jsonl.touch()
+    tomls_dir = tmp_path / "tomls"
+    tomls_dir.mkdir()
+    (tomls_dir / "github#example#example#pyproject.toml").write_text('[tool.ruff]\nselect = ["E", "F"]\n')
+
+    cli_args, forbidden = COMMANDS[command]
+    cli_args = [arg.format(empty_jsonl=empty_jsonl, tomls_dir=tomls_dir) for arg in cli_args]
+    modules = get_imported_modules(cli_args, cwd=tmp_path)
+    assert "ruff_usage_aggregate.cli" in modules
+    unwanted = sorted(
+        prefix for prefix in forbidden if any(module == prefix or module.startswith(f"{prefix}.") for module in modules)
+    )
+    assert not unwanted, f"`{command}` imports {', '.join(unwanted)}"
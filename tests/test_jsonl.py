@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import pathlib
+from dataclasses import dataclass
+
+import pytest
+
+from ruff_usage_aggregate.helpers import jsonl
+from ruff_usage_aggregate.helpers.jsonl import MappedJSONL, read_jsonl, write_jsonl
+
+
+@dataclass
+class KnownToml:
+    owner: str
+    repo: str
+    path: str
+
+
+RECORDS = [
+    {"owner": "akx", "repo": "ruff-usage-aggregate", "path": "pyproject.toml"},
+    {"owner": "astral-sh", "repo": "ruff", "path": "ruff.toml"},
+]
+
+
+@pytest.fixture(params=["json", "orjson", "msgspec"])
+def backend(request, monkeypatch) -> str:
+    if request.param != "json":
+        pytest.importorskip(request.param)
+    monkeypatch.setattr(jsonl, "JSON_BACKEND", request.param)
+    return request.param
+
+
+def test_read_jsonl_record_type(tmp_path: pathlib.Path, backend: str):
+    pth = tmp_path / "known.jsonl"
+    write_jsonl(pth, RECORDS)
+    assert list(read_jsonl(pth)) == RECORDS
+    assert list(read_jsonl(pth, record_type=KnownToml)) == [KnownToml(**record) for record in RECORDS]
+    with MappedJSONL(pth, record_type=KnownToml) as mapped:
+        assert mapped[-1] == KnownToml(**RECORDS[-1])
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import json
+
+from ruff_usage_aggregate.format.markdown import format_markdown
+from ruff_usage_aggregate.models import Aggregator, RuffConfig
+
+
+def test_sharded_markdown_matches_single_run(ruff_configs: list[RuffConfig]):
+    single = Aggregator()
+    for config in ruff_configs:
+        single.add(config)
+
+    merged = Aggregator.mergeable()
+    for shard in (ruff_configs[::2], ruff_configs[1::2]):
+        partial = Aggregator.mergeable()
+        for config in shard:
+            partial.add(config)
+        # Round-trip through JSON, as `merge-aggregates` reads shards from files.
+        merged.merge(Aggregator.from_dict(json.loads(json.dumps(partial.to_dict()))))
+
+    merged_result = merged.result()
+    assert merged_result.most_common_set_values["target_version"] == "py38"
+    assert format_markdown(merged_result) == format_markdown(single.result())
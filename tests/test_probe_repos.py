@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from ruff_usage_aggregate.actions.probe_repos import probe_repo
+
+
+def run_probe(handler) -> dict | None:
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await probe_repo(client, "akx/example")
+
+    return asyncio.run(_run())
+
+
+def test_probe_finds_ruff_config():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/akx/example/master/pyproject.toml":
+            return httpx.Response(200, content=b"[tool.ruff]\nline-length = 100\n")
+        return httpx.Response(404)
+
+    assert run_probe(handler) == {"owner": "akx", "repo": "example", "path": "pyproject.toml", "ref": "master"}
+
+
+def test_probe_not_found():
+    assert run_probe(lambda request: httpx.Response(404)) is None
+
+
+@pytest.mark.parametrize("status_code", [403, 429, 503])
+def test_probe_raises_when_undecided(status_code: int):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/akx/example/main/ruff.toml":
+            return httpx.Response(status_code)
+        return httpx.Response(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run_probe(handler)
+
+
+def test_probe_prefers_earlier_guesses():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/akx/example/main/pyproject.toml":
+            # The first guess answering last must still win.
+            await asyncio.sleep(0.05)
+        if request.url.path.endswith(".toml"):
+            return httpx.Response(200, content=b"[tool.ruff]\n")
+        return httpx.Response(404)
+
+    assert run_probe(handler) == {"owner": "akx", "repo": "example", "path": "pyproject.toml", "ref": "main"}
+
+
+def test_probe_hit_despite_earlier_error():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/akx/example/main/pyproject.toml":
+            return httpx.Response(503)
+        if request.url.path == "/akx/example/main/ruff.toml":
+            return httpx.Response(200, content=b"[lint]\n# ruff\n")
+        return httpx.Response(404)
+
+    assert run_probe(handler) == {"owner": "akx", "repo": "example", "path": "ruff.toml", "ref": "main"}
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+
+from ruff_usage_aggregate.helpers.rate_limit import RateLimiter
+
+URL = "https://raw.githubusercontent.com/akx/example/master/pyproject.toml"
+
+
+def get_handler(responses: list[httpx.Response], requests: list[httpx.Request]):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses[min(len(requests), len(responses)) - 1]
+
+    return handler
+
+
+def test_send_sync_retries_rate_limited():
+    limiter = RateLimiter()
+    requests = []
+    responses = [
+        httpx.Response(429, headers={"retry-after": "0"}),
+        httpx.Response(403, headers={"x-ratelimit-remaining": "0"}),
+        httpx.Response(200, text="ok"),
+    ]
+    transport = httpx.MockTransport(get_handler(responses, requests))
+    with httpx.Client(transport=transport, event_hooks=limiter.sync_event_hooks()) as client:
+        resp = limiter.send_sync(lambda: client.get(URL), back_off=0)
+    assert (resp.status_code, resp.text) == (200, "ok")
+    assert len(requests) == 3
+
+
+def test_send_sync_does_not_retry_forbidden():
+    limiter = RateLimiter()
+    requests = []
+    transport = httpx.MockTransport(get_handler([httpx.Response(403)], requests))
+    with httpx.Client(transport=transport, event_hooks=limiter.sync_event_hooks()) as client:
+        assert limiter.send_sync(lambda: client.get(URL), back_off=0).status_code == 403
+    assert len(requests) == 1
+
+
+def test_send_async_gives_up():
+    limiter = RateLimiter()
+    requests = []
+    transport = httpx.MockTransport(get_handler([httpx.Response(429, headers={"retry-after": "0"})], requests))
+
+    async def _run() -> httpx.Response:
+        async with httpx.AsyncClient(transport=transport, event_hooks=limiter.async_event_hooks()) as client:
+            return await limiter.send_async(lambda: client.get(URL), max_retries=2, back_off=0)
+
+    assert asyncio.run(_run()).status_code == 429
+    assert len(requests) == 3
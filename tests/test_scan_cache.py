@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+import pathlib
+
+from ruff_usage_aggregate.actions.scan_tomls import scan_tomls
+from ruff_usage_aggregate.helpers.corpus_store import CorpusStore
+from ruff_usage_aggregate.helpers.scan_cache import ScanCache
+
+PYPROJECT_A = b'[tool.ruff]\nselect = ["E", "F"]\n'
+PYPROJECT_B = b"[tool.ruff]\nline-length = 100\n"
+
+
+def _rescan(input_directory: pathlib.Path, cache: ScanCache) -> tuple[int, int]:
+    cache.stats.hits = cache.stats.misses = 0
+    assert scan_tomls(input_directory, cache=cache).n_total == 2
+    return (cache.stats.hits, cache.stats.misses)
+
+
+def test_directory_cache_hits_until_file_changes(tmp_path: pathlib.Path):
+    input_directory = tmp_path / "tomls"
+    input_directory.mkdir()
+    pth_a = input_directory / "a_pyproject.toml"
+    pth_a.write_bytes(PYPROJECT_A)
+    (input_directory / "b_pyproject.toml").write_bytes(PYPROJECT_B)
+    with ScanCache(tmp_path / "cache.sqlite") as cache:
+        assert _rescan(input_directory, cache) == (0, 2)
+        assert _rescan(input_directory, cache) == (2, 0)
+        # A touched file needs to be read again...
+        stat = pth_a.stat()
+        os.utime(pth_a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert cache.get_text_hash(pth_a.name, pth_a.stat()) is None
+        assert _rescan(input_directory, cache) == (1, 1)
+        assert _rescan(input_directory, cache) == (2, 0)
+        # ... as does one whose size changed, even if its mtime didn't.
+        stat = pth_a.stat()
+        pth_a.write_bytes(PYPROJECT_A + b"line-length = 120\n")
+        os.utime(pth_a, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert cache.get_text_hash(pth_a.name, pth_a.stat()) is None
+        assert _rescan(input_directory, cache) == (1, 1)
+
+
+def test_invalidate_store_cache(tmp_path: pathlib.Path):
+    with CorpusStore(tmp_path / "tomls.sqlite") as store, ScanCache(tmp_path / "cache.sqlite") as cache:
+        store.put({"owner": "a", "repo": "a", "path": "pyproject.toml"}, PYPROJECT_A)
+        store.put({"owner": "b", "repo": "b", "path": "pyproject.toml"}, PYPROJECT_B)
+        scan_tomls(None, store=store, cache=cache)
+        # Nothing is stale yet...
+        assert cache.invalidate(store=store) == (0, 0)
+        # ... but once a file changes, its old config is.
+        store.put({"owner": "b", "repo": "b", "path": "pyproject.toml"}, PYPROJECT_A)
+        assert cache.invalidate(store=store) == (0, 1)
+        result = scan_tomls(None, store=store, cache=cache)
+        assert result.n_total == 2
+        assert cache.stats.misses == 2  # both contents were only parsed by the first scan
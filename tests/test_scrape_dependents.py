@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+import pathlib
+
+import httpx
+import pytest
+
+from ruff_usage_aggregate.actions import probe_repos, scrape_dependents
+from ruff_usage_aggregate.actions.probe_repos import ProbeNegativeCache
+from ruff_usage_aggregate.actions.scrape_dependents import (
+    DependentsCheckpoint,
+    get_dependents_url,
+    scrape_dependents_async,
+)
+
+PAGES = {
+    get_dependents_url("astral-sh/ruff"): (["a/one", "a/two"], "page-2"),
+    "page-2": (["b/one", "b/two"], "page-3"),
+    "page-3": (["c/one"], None),
+}
+
+
+def scrape(tmp_path: pathlib.Path, monkeypatch, failing: set[str]) -> DependentsCheckpoint:
+    async def fetch_page(client: httpx.AsyncClient, url: str):
+        return PAGES[url]
+
+    async def probe_repo(client: httpx.AsyncClient, owner_and_repo: str):
+        if owner_and_repo in failing:
+            raise httpx.ConnectError("connection reset")
+        return None
+
+    monkeypatch.setattr(scrape_dependents, "_fetch_page", fetch_page)
+    monkeypatch.setattr(probe_repos, "probe_repo", probe_repo)
+    checkpoint = DependentsCheckpoint(tmp_path / "checkpoint.json")
+    with ProbeNegativeCache(tmp_path / "negative.jsonl", ttl=3600) as negative_cache:
+        asyncio.run(
+            scrape_dependents_async(
+                checkpoint=checkpoint,
+                emit=lambda datum: None,
+                known_repos=set(),
+                negative_cache=negative_cache,
+            ),
+        )
+    return DependentsCheckpoint(checkpoint.path)
+
+
+@pytest.mark.parametrize(
+    ("failing", "expected_state"),
+    [
+        (set(), (None, 3)),
+        ({"b/two"}, ("page-2", 1)),
+        ({"b/two", "c/one"}, ("page-2", 1)),
+    ],
+)
+def test_failed_probe_does_not_advance_checkpoint(tmp_path: pathlib.Path, monkeypatch, failing, expected_state):
+    checkpoint = scrape(tmp_path, monkeypatch, failing)
+    assert (checkpoint.state["next_url"], checkpoint.state["pages"]) == expected_state
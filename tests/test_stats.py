@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import random
+import statistics
+from collections import Counter
+
+import pytest
+
+from ruff_usage_aggregate.helpers.stats import counter_mean, counter_median, counter_mode, counter_quantile
+
+COUNTERS = [
+    Counter({88: 1}),
+    Counter({79: 1, 120: 1}),
+    Counter({88: 3, 100: 2, 120: 1, 79: 0}),
+    Counter({88: 10, 100: 10, 79: 5, 120: 5}),
+    Counter(random.Random(42).choices([72, 79, 88, 100, 110, 120, 150, 200], k=501)),
+]
+
+
+def _flatten(counter: Counter) -> list[int]:
+    return sorted(counter.elements())
+
+
+@pytest.mark.parametrize("counter", COUNTERS)
+def test_counter_stats_match_flat_data(counter: Counter):
+    data = _flatten(counter)
+    assert counter_median(counter) == statistics.median(data)
+    assert counter_mean(counter) == pytest.approx(statistics.mean(data))
+    assert counter_mode(counter) == min(statistics.multimode(data))
+
+
+@pytest.mark.parametrize("counter", COUNTERS)
+@pytest.mark.parametrize("q", [0, 0.1, 0.5, 0.9, 0.99, 1])
+def test_counter_quantile_matches_numpy(counter: Counter, q: float):
+    np = pytest.importorskip("numpy")
+    assert counter_quantile(counter, q) == pytest.approx(np.quantile(_flatten(counter), q))
+
+
+@pytest.mark.parametrize("func", [counter_median, counter_mean, counter_mode, lambda c: counter_quantile(c, 0.5)])
+def test_counter_stats_reject_empty_data(func):
+    with pytest.raises(statistics.StatisticsError):
+        func(Counter())
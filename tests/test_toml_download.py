@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+import pathlib
+
+import httpx
+import pytest
+
+from ruff_usage_aggregate.actions import toml_download
+from ruff_usage_aggregate.actions.toml_download import download_with_retries
+
+DATUM = {"owner": "akx", "repo": "example", "path": "pyproject.toml", "ref": "master"}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(toml_download, "RETRY_BACKOFF", 0)
+
+
+def download(tmp_path: pathlib.Path, responses: list[httpx.Response | Exception]) -> tuple[str, int]:
+    n_requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal n_requests
+        response = responses[min(n_requests, len(responses) - 1)]
+        n_requests += 1
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await download_with_retries(client=client, output_directory=tmp_path, datum=DATUM)
+
+    return asyncio.run(_run()), n_requests
+
+
+@pytest.mark.parametrize("transient", [httpx.Response(502), httpx.ConnectError("connection reset")])
+def test_download_retries_transient_errors(tmp_path: pathlib.Path, transient):
+    content = b"[tool.ruff]\nline-length = 100\n"
+    assert download(tmp_path, [transient, httpx.Response(200, content=content)]) == ("downloaded", 2)
+    (pth,) = tmp_path.glob("*.toml")
+    assert pth.read_bytes() == content
+
+
+def test_download_gives_up(tmp_path: pathlib.Path):
+    assert download(tmp_path, [httpx.Response(503)]) == ("failed", toml_download.MAX_RETRIES + 1)
+    assert download(tmp_path, [httpx.Response(401)]) == ("failed", 1)
+    assert not list(tmp_path.glob("*.toml"))